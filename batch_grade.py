@@ -0,0 +1,193 @@
+"""Grade a manifest of recorded attempts across a pool of processes.
+
+    python batch_grade.py manifest.csv results.jsonl --workers 8
+
+The manifest is CSV (with a header) or JSONL with one attempt per row:
+``video`` (path), ``test`` (a runner.py test name), optional ``height``
+(cm) and optional ``id`` (defaults to the video path). Every worker process
+loads its own model once and runs with its own cv2 thread budget. Results
+are appended to the output (JSONL, or CSV if it ends in .csv) as attempts
+finish, and attempts already graded there are skipped, so an interrupted
+run picks up where it stopped.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+import runner
+from yolo_onnx import get_pose_model
+
+CSV_FIELDS = ["id", "video", "test", "height", "status", "error", "frames", "fps", "wall_s", "result"]
+
+
+def read_jsonl(f, path):
+    """Entries of a JSONL file, skipping lines that do not parse (e.g. cut off mid-write)."""
+    for n, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            print(f"[WARN] Skipping unreadable line {n} of {path}", file=sys.stderr)
+
+
+def read_manifest(path):
+    with open(path, newline="") as f:
+        if path.endswith(".jsonl"):
+            rows = list(read_jsonl(f, path))
+        else:
+            rows = list(csv.DictReader(f))
+    for row in rows:
+        row.setdefault("id", row["video"])
+        row["id"] = str(row["id"] or row["video"])
+        row["height"] = float(row.get("height") or 170)
+    return rows
+
+
+def read_done(path):
+    """IDs already graded successfully in an existing output file."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            entries = csv.DictReader(f)
+        else:
+            entries = read_jsonl(f, path)
+        for entry in entries:
+            if entry.get("status") == "ok":
+                done.add(str(entry["id"]))
+    return done
+
+
+POSE_MODEL = "yolov8n-pose.onnx"
+
+# Set by init_worker when the model cannot be loaded in this process
+_init_error = None
+
+
+def init_worker(threads, verbose):
+    global _init_error
+    cv2.setNumThreads(threads)
+    if not verbose:
+        # Analyzers print progress; hundreds of attempts would drown the log
+        sys.stdout = open(os.devnull, "w")
+    # Load and warm up the pose model once per process, not once per attempt.
+    # An exception escaping an initializer makes the Pool respawn workers
+    # forever, so keep it and report it for every attempt instead
+    try:
+        get_pose_model(POSE_MODEL)
+    except Exception as e:
+        _init_error = f"{type(e).__name__}: {e}"
+
+
+def grade(row):
+    entry = {"id": row["id"], "video": row["video"], "test": row["test"], "height": row["height"]}
+    if _init_error is not None:
+        entry.update(status="error", error=f"worker could not load {POSE_MODEL}: {_init_error}")
+        return entry
+    try:
+        report = runner.run(row["test"], row["video"], row["height"])
+    except Exception as e:
+        entry.update(status="error", error=f"{type(e).__name__}: {e}")
+        return entry
+    entry.update(status="ok", frames=report["frames"], fps=report["fps"], wall_s=report["wall_s"],
+                 result=report["result"])
+    return entry
+
+
+def drop_partial_line(path):
+    """Cut off a last line left unfinished by a killed run, so appends start on a fresh line."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class ResultWriter:
+    def __init__(self, path):
+        self.csv = path.endswith(".csv")
+        drop_partial_line(path)
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.f = open(path, "a", newline="")
+        if self.csv:
+            self.writer = csv.DictWriter(self.f, fieldnames=CSV_FIELDS)
+            if new:
+                self.writer.writeheader()
+
+    def write(self, entry):
+        if self.csv:
+            row = dict(entry)
+            if "result" in row:
+                row["result"] = json.dumps(row["result"])
+            self.writer.writerow(row)
+        else:
+            self.f.write(json.dumps(entry) + "\n")
+        # Flush per attempt so an interrupted run loses nothing finished
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def grade_all(manifest, output, workers=None, threads=1, verbose=False):
+    rows = read_manifest(manifest)
+    done = read_done(output)
+    todo = [row for row in rows if row["id"] not in done]
+    print(f"[INFO] {len(rows)} attempts, {len(rows) - len(todo)} already graded, {len(todo)} to go", file=sys.stderr)
+    if not todo:
+        return True
+
+    # Fail fast on a missing or broken model before starting any worker
+    try:
+        get_pose_model(POSE_MODEL)
+    except Exception as e:
+        print(f"[ERROR] Cannot load {POSE_MODEL}: {type(e).__name__}: {e}", file=sys.stderr)
+        return False
+
+    workers = workers or os.cpu_count() or 1
+    writer = ResultWriter(output)
+    start = time.perf_counter()
+    # spawn: forking a process that already holds OpenCV threads can deadlock
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        with ctx.Pool(workers, initializer=init_worker, initargs=(threads, verbose)) as pool:
+            for n, entry in enumerate(pool.imap_unordered(grade, todo), 1):
+                writer.write(entry)
+                elapsed = time.perf_counter() - start
+                print(f"[INFO] {n}/{len(todo)} {entry['id']}: {entry['status']} "
+                      f"({n / elapsed:.2f} attempts/s)", file=sys.stderr)
+    finally:
+        writer.close()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade recorded attempts in parallel.")
+    parser.add_argument("manifest", help="CSV or JSONL with video, test, height, id")
+    parser.add_argument("output", help="results file, JSONL or .csv; appended to and resumed from")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per core)")
+    parser.add_argument("--threads", type=int, default=1, help="cv2 threads per worker")
+    parser.add_argument("--verbose", action="store_true", help="keep analyzer output")
+    args = parser.parse_args(argv)
+
+    try:
+        if not grade_all(args.manifest, args.output, args.workers, args.threads, args.verbose):
+            return 1
+    except KeyboardInterrupt:
+        # Finished attempts are already in the output; rerun to resume
+        print("[WARN] Interrupted", file=sys.stderr)
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""Per-stage benchmark of all analyzers, headless and CPU-only.
+
+    python benchmark.py --output report.json
+    python benchmark.py --source captured_frames --baseline baseline.json
+    python benchmark.py --save-baseline baseline.json
+
+Times decode, preprocess, forward, postprocess, analyzer logic, overlay
+drawing and texture conversion for every analyzer on a fixed frame set
+(synthetic by default, or a recording), and reports p50/p95/p99 latency,
+throughput, peak traced memory and texture allocations/copies per frame
+as JSON. The texture upload (one allocation per frame size, no copy of
+contiguous frames) and camera startup against stand-in cameras (the
+preferred camera wins, time to first frame) are also checked on their
+own. With ``--baseline`` the run is compared against a stored report; a
+failed check or a regression exits non-zero.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import runner
+from camera import ANDROID_CANDIDATES, CameraOpener, open_camera
+from display import FrameUploader
+from overlay import fit_to_display
+from yolo_onnx import _YOLOv8Model
+
+STAGES = ["decode", "preprocess", "forward", "postprocess", "analyzer", "draw", "texture", "total"]
+
+# Attributes that may hold a model, directly or inside a wrapper (RoiPose, FlowPose)
+MODEL_ATTRS = ("model", "roi_model", "pose_model", "box_model")
+
+
+class TimedModel:
+    """Runs a YOLOv8 model stage by stage and records each stage's time."""
+
+    def __init__(self, model, timings):
+        self.model = model
+        self.timings = timings
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __call__(self, img, verbose=False, **kwargs):
+        t0 = time.perf_counter()
+        geometry = self.model.preprocess(img)
+        t1 = time.perf_counter()
+        out = self.model.forward()
+        t2 = time.perf_counter()
+        results = self.model.postprocess(out, geometry, **kwargs)
+        t3 = time.perf_counter()
+        self.timings["preprocess"] += t1 - t0
+        self.timings["forward"] += t2 - t1
+        self.timings["postprocess"] += t3 - t2
+        return results
+
+
+def instrument(holder, timings):
+    """Swap every YOLOv8 model reachable from ``holder`` for a TimedModel."""
+    for attr in MODEL_ATTRS:
+        obj = vars(holder).get(attr)
+        if isinstance(obj, _YOLOv8Model):
+            setattr(holder, attr, TimedModel(obj, timings))
+        elif obj is not None and hasattr(obj, "__dict__"):
+            instrument(obj, timings)
+
+
+def synthetic_frames(n, size=(1280, 720), seed=0):
+    """JPEG-encoded frames of a bright figure drifting over a noisy background."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    background = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (9, 9), 0)
+    encoded = []
+    for i in range(n):
+        frame = background.copy()
+        x = int(w * 0.3 + (w * 0.4) * i / max(n - 1, 1))
+        cv2.rectangle(frame, (x, int(h * 0.15)), (x + w // 10, int(h * 0.9)), (220, 200, 180), -1)
+        cv2.circle(frame, (x + w // 20, int(h * 0.1)), h // 20, (200, 180, 170), -1)
+        encoded.append(cv2.imencode(".jpg", frame)[1])
+    return encoded
+
+
+def recorded_frames(source, n):
+    encoded = []
+    for _, frame, _ in runner.iter_frames(source):
+        encoded.append(cv2.imencode(".jpg", frame)[1])
+        if len(encoded) >= n:
+            break
+    return encoded
+
+
+def bench_analyzer(test, encoded, display_size, warmup=5, height_cm=170):
+    processor = runner.ANALYZERS[test](height_cm)
+    processor.overlay.render_on_frame = False
+    timings = dict.fromkeys(STAGES[1:4], 0.0)
+    instrument(processor, timings)
+
+    uploader = FrameUploader(_HeadlessTexture)
+    samples = {stage: [] for stage in STAGES}
+
+    for i, buf in enumerate(encoded):
+        for stage in timings:
+            timings[stage] = 0.0
+
+        t0 = time.perf_counter()
+        frame = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        t1 = time.perf_counter()
+        frame = processor.process_frame(frame)
+        t2 = time.perf_counter()
+        shown = fit_to_display(frame, display_size)
+        processor.overlay.snapshot().render(shown)
+        t3 = time.perf_counter()
+        uploader.upload(shown)
+        t4 = time.perf_counter()
+
+        if i < warmup:
+            continue
+        model_s = sum(timings.values())
+        samples["decode"].append(t1 - t0)
+        for stage, elapsed in timings.items():
+            samples[stage].append(elapsed)
+        samples["analyzer"].append(max(0.0, (t2 - t1) - model_s))
+        samples["draw"].append(t3 - t2)
+        samples["texture"].append(t4 - t3)
+        samples["total"].append(t4 - t0)
+
+    stats = {stage: runner.latency_stats(values) for stage, values in samples.items()}
+    return {"stages": stats, "throughput_fps": stats["total"].get("fps"), "upload": uploader.stats()}
+
+
+def peak_memory(test, encoded, frames=20, height_cm=170):
+    """Peak traced allocation (MB) while analyzing a few frames."""
+    processor = runner.ANALYZERS[test](height_cm)
+    processor.overlay.render_on_frame = False
+    tracemalloc.start()
+    try:
+        for buf in encoded[:frames]:
+            processor.process_frame(cv2.imdecode(buf, cv2.IMREAD_COLOR))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 2**20, 2)
+
+
+class _HeadlessTexture:
+    """Stand-in texture: blit copies into a preallocated buffer like a GPU upload would."""
+
+    def __init__(self, size):
+        self.buffer = np.empty(size[0] * size[1] * 3, dtype=np.uint8)
+
+    def flip_vertical(self):
+        pass
+
+    def blit_buffer(self, pbuffer, colorfmt=None, bufferfmt=None):
+        self.buffer[:] = np.frombuffer(pbuffer, dtype=np.uint8)
+
+
+def check_uploader(size=(640, 480), frames=10):
+    """Headless check of FrameUploader's cost: one texture per frame size, no copy of contiguous frames.
+
+    Returns a list of failures (empty when it behaves).
+    """
+    w, h = size
+    uploader = FrameUploader(_HeadlessTexture)
+    failures = []
+
+    frame = np.zeros((h, w, 3), dtype=np.uint8)
+    for _ in range(frames):
+        uploader.upload(frame)
+    if uploader.allocations != 1:
+        failures.append(f"{uploader.allocations} allocations for {frames} frames of one size, expected 1")
+    if uploader.copies != 0:
+        failures.append(f"{uploader.copies} copies of contiguous frames, expected 0")
+
+    small = np.zeros((h // 2, w // 2, 3), dtype=np.uint8)
+    for _ in range(frames):
+        uploader.upload(small)
+    if uploader.allocations != 2:
+        failures.append(f"{uploader.allocations} allocations after one size change, expected 2")
+
+    # A strided view is the only thing that should be copied
+    uploader.upload(frame[:, ::2])
+    if uploader.copies != 1:
+        failures.append(f"{uploader.copies} copies after one non-contiguous frame, expected 1")
+    return failures
+
+
+class _StandInCapture:
+    """Stand-in VideoCapture: each index is one exclusive device that
+    delivers frames ``delays[index]`` seconds after opening (None: never)."""
+
+    delays = {}
+    _held = set()
+    _lock = threading.Lock()
+
+    def __init__(self, index, backend=None):
+        self.device = max(index, 0)
+        self.opened_at = time.monotonic()
+        with self._lock:
+            self.ok = self.device in self.delays and self.device not in self._held
+            if self.ok:
+                self._held.add(self.device)
+
+    def isOpened(self):
+        return self.ok
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        return 0
+
+    def read(self):
+        delay = self.delays.get(self.device)
+        if self.ok and delay is not None and time.monotonic() - self.opened_at >= delay:
+            return True, np.zeros((4, 4, 3), dtype=np.uint8)
+        return False, None
+
+    def release(self):
+        with self._lock:
+            if self.ok:
+                self._held.discard(self.device)
+                self.ok = False
+
+
+def check_camera_open(timeout=1.0):
+    """Headless time-to-first-frame check of the Android camera probe.
+
+    The back camera (index 0) answers after 0.2 s, the selfie camera
+    (index 1) after 0.05 s. The back camera must win, within about its own
+    delay (probes of distinct devices run in parallel), and no device may
+    be left held. Returns ``(report, failures)``.
+    """
+    _StandInCapture.delays = {0: 0.2, 1: 0.05}
+    _StandInCapture._held = set()
+    opener = CameraOpener(open_camera, candidates=ANDROID_CANDIDATES, capture_factory=_StandInCapture,
+                          timeout=timeout, cache_path=None).start()
+    opener.done.wait(timeout * len(ANDROID_CANDIDATES) + 2.0)
+    failures = []
+    report = {"time_to_first_frame_s": opener.time_to_first_frame}
+    if opener.result is None:
+        failures.append("no camera opened")
+        return report, failures
+    cap = opener.result[0]
+    report["device"] = cap.device
+    if cap.device != 0:
+        failures.append(f"opened device {cap.device}, expected the preferred device 0")
+    if opener.time_to_first_frame > _StandInCapture.delays[0] + 0.25:
+        failures.append(f"first frame after {opener.time_to_first_frame:.2f} s, "
+                        f"expected about {_StandInCapture.delays[0]:.2f} s")
+    cap.release()
+    time.sleep(0.1) # Let losing probes finish releasing
+    if _StandInCapture._held:
+        failures.append(f"devices {sorted(_StandInCapture._held)} left open")
+    return report, failures
+
+
+def compare(report, baseline, threshold):
+    """Regressions of more than ``threshold`` (fraction) against ``baseline``."""
+    regressions = []
+    for test, current in report["analyzers"].items():
+        base = baseline.get("analyzers", {}).get(test)
+        if not base:
+            continue
+        for stage, stats in current["stages"].items():
+            base_stats = base["stages"].get(stage, {})
+            for key in ("p50_ms", "p95_ms"):
+                old, new = base_stats.get(key), stats.get(key)
+                # Ignore sub-0.05 ms stages, their noise dwarfs any real change
+                if old and new and old > 0.05 and new > old * (1 + threshold):
+                    regressions.append(f"{test}.{stage}.{key}: {old:.3f} -> {new:.3f}")
+        old, new = base.get("throughput_fps"), current.get("throughput_fps")
+        if old and new and new < old * (1 - threshold):
+            regressions.append(f"{test}.throughput_fps: {old:.2f} -> {new:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every analyzer stage by stage.")
+    parser.add_argument("--tests", nargs="+", choices=sorted(runner.ANALYZERS), default=sorted(runner.ANALYZERS))
+    parser.add_argument("--source", help="video or image directory (default: synthetic frames)")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 720), metavar=("W", "H"),
+                        help="synthetic frame size")
+    parser.add_argument("--display", type=int, nargs=2, default=(1080, 1920), metavar=("W", "H"),
+                        help="display size overlays are drawn at")
+    parser.add_argument("--threads", type=int, default=1, help="cv2.setNumThreads budget")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown, as a fraction")
+    parser.add_argument("--save-baseline", help="also store this run as a baseline")
+    args = parser.parse_args(argv)
+
+    cv2.setNumThreads(args.threads)
+    if args.source:
+        encoded = recorded_frames(args.source, args.frames)
+    else:
+        encoded = synthetic_frames(args.frames, tuple(args.size))
+
+    report = {
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count(),
+                    "python": platform.python_version(), "opencv": cv2.__version__},
+        "config": {"source": args.source or "synthetic", "frames": len(encoded),
+                   "display": list(args.display), "threads": args.threads},
+        "analyzers": {},
+    }
+    with runner.quiet_stdout():
+        for test in args.tests:
+            result = bench_analyzer(test, encoded, tuple(args.display))
+            result["peak_mem_mb"] = peak_memory(test, encoded)
+            report["analyzers"][test] = result
+
+    status = 0
+    upload_failures = check_uploader()
+    report["upload_check"] = upload_failures
+    if upload_failures:
+        print("[WARN] Texture upload check failed:\n  " + "\n  ".join(upload_failures), file=sys.stderr)
+        status = 1
+    with runner.quiet_stdout():
+        camera_open, camera_failures = check_camera_open()
+    report["camera_open"] = dict(camera_open, failures=camera_failures)
+    if camera_failures:
+        print("[WARN] Camera open check failed:\n  " + "\n  ".join(camera_failures), file=sys.stderr)
+        status = 1
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+        if regressions:
+            print("[WARN] Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            status = 1
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
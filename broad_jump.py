@@ -1,10 +1,13 @@
 import cv2
 import numpy as np
-from yolo_onnx import YOLOv8Pose
+from yolo_onnx import get_pose_model
+from overlay import Overlay
+from ring_buffer import RollingStats
+from jump_timing import frame_time, crossing
 
 class BroadJumpAnalyzer:
     def __init__(self, user_height_cm=170):
-        self.model = YOLOv8Pose("yolov8n-pose.onnx")
+        self.model = get_pose_model("yolov8n-pose.onnx")
         self.user_height_cm = user_height_cm
         
         # State: 0=Ready, 1=In Air, 2=Landed
@@ -18,17 +21,34 @@ class BroadJumpAnalyzer:
         
         self.calibrated_torso_px = None
         self.calibrated_height_px = None
+        # Calibrate over a stretch of time, not a frame count, so skipped
+        # or dropped frames do not change it
         self.calibration_frames = 0
-        self.CALIBRATION_LIMIT = 30
+        self.calibration_start = None
+        self.calibrated = False
+        self.CALIBRATION_SECONDS = 1.0
+        self.MIN_CALIBRATION_FRAMES = 5
         
         self.START_DEPTH_CM = 260.0 
         
-        self.ankle_history = []
         self.SMOOTHING_WINDOW = 2
+        self.ankle_history = RollingStats(self.SMOOTHING_WINDOW, shape=(2,))
         
         self.max_y_during_jump = 0
         self.jump_distance_cm = 0.0
         self.last_jump_distance_cm = 0.0
+        # Previous sample (t, x_cm, rise_cm) and interpolated jump instants
+        self.prev_sample = None
+        self.takeoff_t = None
+        self.flight_time_s = None
+        # The 10 cm rise only confirms a jump; take-off and touch-down are
+        # timed where the raw rise crosses the standing level, allowing this
+        # much pose noise around it
+        self.GROUND_CM = 2.0
+        # Feet settled near, but never quite back to, the standing level
+        self.LANDING_SETTLE_S = 0.2
+        self.near_ground_t = None
+        self.overlay = Overlay()
         
         # Anthropometric ratio
         if self.user_height_cm >= 180:
@@ -38,12 +58,16 @@ class BroadJumpAnalyzer:
         else:
             self.TORSO_RATIO = 0.55 + (self.user_height_cm - 175) * (-0.04)
 
-    def process_frame(self, frame):
-        results = self.model(frame)
+    def process_frame(self, frame, timestamp=None):
+        return self.process_pose(frame, self.model(frame), timestamp)
+
+    def process_pose(self, frame, results, timestamp=None):
+        self.overlay.begin(frame.shape)
+        t = frame_time(timestamp)
         
         # Draw skeleton
         if results.keypoints.data is not None:
-            frame = self.model.draw_skeleton(frame, results.keypoints.data)
+            self.overlay.skeleton(results.keypoints.data)
             
             kps = results.keypoints.data # (17, 3)
             
@@ -70,14 +94,13 @@ class BroadJumpAnalyzer:
                 
                 # Smoothing
                 self.ankle_history.append((raw_avg_x, raw_avg_y))
-                if len(self.ankle_history) > self.SMOOTHING_WINDOW:
-                    self.ankle_history.pop(0)
-                avg_ankle_x = np.mean([p[0] for p in self.ankle_history])
-                avg_ankle_y = np.mean([p[1] for p in self.ankle_history])
+                avg_ankle_x, avg_ankle_y = self.ankle_history.mean()
                 
                 # Calibration
-                if self.state == 0 and self.calibration_frames < self.CALIBRATION_LIMIT:
+                if self.state == 0 and not self.calibrated:
                     if height_px > 50:
+                        if self.calibration_start is None:
+                            self.calibration_start = t
                         if self.calibrated_torso_px is None:
                             self.calibrated_torso_px = torso_len_px
                             self.calibrated_height_px = height_px
@@ -86,10 +109,12 @@ class BroadJumpAnalyzer:
                             self.calibrated_height_px = (self.calibrated_height_px * self.calibration_frames + height_px) / (self.calibration_frames + 1)
                         
                         self.calibration_frames += 1
-                        cv2.putText(frame, f"Calibrating... {int(self.calibration_frames/self.CALIBRATION_LIMIT*100)}%", (20, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+                        elapsed = t - self.calibration_start
+                        self.calibrated = elapsed >= self.CALIBRATION_SECONDS and self.calibration_frames >= self.MIN_CALIBRATION_FRAMES
+                        self.overlay.text(f"Calibrating... {min(100, int(elapsed/self.CALIBRATION_SECONDS*100))}%", (20, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
                 
                 # Logic
-                if self.calibration_frames >= self.CALIBRATION_LIMIT:
+                if self.calibrated:
                     if self.focal_length is None:
                         real_torso_cm = self.user_height_cm * self.TORSO_RATIO
                         self.focal_length = (self.calibrated_torso_px * self.START_DEPTH_CM) / real_torso_cm
@@ -113,10 +138,25 @@ class BroadJumpAnalyzer:
                     vertical_rise_px = self.start_y - avg_ankle_y
                     vertical_rise_cm = vertical_rise_px * scale_factor
                     
+                    # Raw (unsmoothed) position, for interpolating jump instants
+                    raw_x_cm = raw_avg_x * scale_factor
+                    raw_rise_cm = (self.start_y - raw_avg_y) * scale_factor
+                    prev = self.prev_sample
+                    self.prev_sample = (t, raw_x_cm, raw_rise_cm)
+
                     if self.state == 0:
+                        # Remember the last time the feet left the standing level
+                        if raw_rise_cm <= self.GROUND_CM:
+                            self.takeoff_t = None
+                        elif prev is not None and prev[2] <= self.GROUND_CM:
+                            self.takeoff_t, _ = crossing(prev[0], prev[2], t, raw_rise_cm, 0.0)
+
                         if vertical_rise_cm > 10:
                             self.state = 1 # In Air
                             self.max_y_during_jump = avg_ankle_y
+                            self.near_ground_t = None
+                            if self.takeoff_t is None:
+                                self.takeoff_t = t
                     
                     elif self.state == 1:
                         if avg_ankle_y < self.max_y_during_jump: # Remember Y is down
@@ -124,9 +164,27 @@ class BroadJumpAnalyzer:
                         
                         # Landing detection
                         height_from_ground_cm = (self.start_y - avg_ankle_y) * scale_factor
-                        if height_from_ground_cm < 10: # Back on ground
+                        if prev is not None and raw_rise_cm <= self.GROUND_CM < prev[2]: # Back on ground
                             self.state = 2
-                            self.last_jump_distance_cm = current_dist_cm
+                            # Touch-down happened between the last two samples;
+                            # take the distance where the feet reached the floor
+                            # rather than wherever this frame caught them
+                            landing_t, frac = crossing(prev[0], prev[2], t, raw_rise_cm, 0.0)
+                            landing_x_cm = prev[1] + frac * (raw_x_cm - prev[1])
+                            self.last_jump_distance_cm = np.sqrt((landing_x_cm - self.start_x_cm)**2 + dz**2)
+                            self.flight_time_s = landing_t - self.takeoff_t
+                        elif height_from_ground_cm < 10:
+                            # Landed a little off the standing level (uneven
+                            # floor, pose noise): once the feet have stayed
+                            # down, measure where they are, without a flight time
+                            if self.near_ground_t is None:
+                                self.near_ground_t = t
+                            elif t - self.near_ground_t >= self.LANDING_SETTLE_S:
+                                self.state = 2
+                                self.last_jump_distance_cm = current_dist_cm
+                                self.flight_time_s = None
+                        else:
+                            self.near_ground_t = None
                     
                     elif self.state == 2:
                         if current_dist_cm < 20:
@@ -135,11 +193,14 @@ class BroadJumpAnalyzer:
                     
                     # Drawing
                     if self.start_x:
-                        cv2.circle(frame, (int(self.start_x), int(self.start_y)), 5, (0, 255, 0), -1)
-                        cv2.line(frame, (int(self.start_x), int(self.start_y)), (int(avg_ankle_x), int(avg_ankle_y)), (255, 255, 0), 2)
+                        self.overlay.circle((int(self.start_x), int(self.start_y)), 5, (0, 255, 0), -1)
+                        self.overlay.line((int(self.start_x), int(self.start_y)), (int(avg_ankle_x), int(avg_ankle_y)), (255, 255, 0), 2)
                     
-                    cv2.putText(frame, f"Jump: {current_dist_cm:.1f} cm", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                    self.overlay.text(f"Jump: {current_dist_cm:.1f} cm", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
                     if self.last_jump_distance_cm > 0:
-                        cv2.putText(frame, f"Last: {self.last_jump_distance_cm:.1f} cm", (20, 90), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+                        self.overlay.text(f"Last: {self.last_jump_distance_cm:.1f} cm", (20, 90), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+
+        return self.overlay.finish(frame)
 
-        return frame
+    def summary(self):
+        return {"jump_distance_cm": self.last_jump_distance_cm or None, "flight_time_s": self.flight_time_s}
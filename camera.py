@@ -0,0 +1,368 @@
+import json
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from yolo_onnx import _as_size
+
+CameraMode = namedtuple("CameraMode", "width height fps")
+
+# What the camera is asked for, smallest first. The top mode is what the app
+# always used to request; nothing larger is ever needed for a 640 model.
+CAMERA_MODES = [
+    CameraMode(640, 480, 30),
+    CameraMode(960, 540, 30),
+    CameraMode(1280, 720, 30),
+]
+DEFAULT_MODE = CAMERA_MODES[-1]
+
+
+def pick_mode(input_size=640, display_size=None, modes=CAMERA_MODES):
+    """Smallest mode that still feeds the model and the display at full detail.
+
+    The long side has to cover the model input (the letterbox scales it down
+    to ``input_size``), and the frame, fitted into the ``(w, h)`` area it is
+    shown in (density-independent pixels on phones), must not be upscaled.
+    """
+    need = max(_as_size(input_size))
+    for mode in modes:
+        if max(mode.width, mode.height) < need:
+            continue
+        if display_size and mode.width < display_size[0] and mode.height < display_size[1]:
+            continue
+        return mode
+    return modes[-1]
+
+
+def apply_mode(cap, mode):
+    """Request ``mode`` from an open capture; returns the mode it actually gives."""
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, mode.width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, mode.height)
+    cap.set(cv2.CAP_PROP_FPS, mode.fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    # Drivers round to the nearest mode they support; 0 means "unknown"
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or mode.width
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or mode.height
+    fps = int(round(cap.get(cv2.CAP_PROP_FPS))) or mode.fps
+    return CameraMode(width, height, fps)
+
+
+# Last backend / index that worked, tried first on the next start
+CAMERA_CACHE = "camera_cache.json"
+
+# (backend, index) pairs worth probing, in order of preference
+ANDROID_CANDIDATES = [
+    (cv2.CAP_ANDROID, 0), (cv2.CAP_ANDROID, 1), (cv2.CAP_ANDROID, -1),
+    (cv2.CAP_ANY, 0), (cv2.CAP_ANY, 1),
+]
+DESKTOP_CANDIDATES = [(cv2.CAP_ANY, 0)]
+
+
+def wait_ready(cap, timeout=2.0, poll=0.02):
+    """Poll ``cap`` until it delivers a frame; returns it, or None after ``timeout`` s."""
+    deadline = time.monotonic() + timeout
+    while True:
+        ret, frame = cap.read()
+        if ret and frame is not None and frame.size:
+            return frame
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(poll)
+
+
+def probe(backend, index, mode, capture_factory=cv2.VideoCapture, timeout=2.0):
+    """Open one backend/index, request ``mode`` and wait for a frame.
+
+    Returns ``(cap, actual_mode)`` or None; a capture that never delivers
+    is released.
+    """
+    cap = capture_factory(index, backend)
+    if not cap.isOpened():
+        cap.release()
+        return None
+    actual = apply_mode(cap, mode)
+    if wait_ready(cap, timeout) is None:
+        print(f"[WARN] Camera opened but cannot read frames on backend {backend} index {index}")
+        cap.release()
+        return None
+    return cap, actual
+
+
+def read_camera_cache(path=CAMERA_CACHE):
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        return int(entry["backend"]), int(entry["index"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_camera_cache(backend, index, path=CAMERA_CACHE):
+    try:
+        with open(path, "w") as f:
+            json.dump({"backend": backend, "index": index}, f)
+    except OSError as e:
+        print(f"[WARN] Could not write {path}: {e}")
+
+
+def open_camera(mode=DEFAULT_MODE, candidates=DESKTOP_CANDIDATES, capture_factory=cv2.VideoCapture,
+                timeout=2.0, cache_path=CAMERA_CACHE, status=None):
+    """Open the first camera in ``candidates`` that delivers frames.
+
+    The backend/index remembered in ``cache_path`` is tried on its own
+    first. Otherwise distinct devices are probed at once, one thread each;
+    the backends for one device (index -1 being the default device, 0)
+    are tried one after another on its thread, since a camera can only be
+    opened once. The first candidate in order of preference to deliver a
+    frame wins: a faster one further down only wins once every one before
+    it has failed or timed out. The others are released.
+    ``status(text)`` is called with progress messages. Returns
+    ``(cap, actual_mode)`` or None.
+    """
+    status = status or (lambda text: None)
+    cached = read_camera_cache(cache_path) if cache_path else None
+    if cached is not None:
+        status(f"Opening camera {cached[1]}")
+        try:
+            opened = probe(cached[0], cached[1], mode, capture_factory, timeout)
+        except Exception as e:
+            print(f"[WARN] Remembered camera {cached} failed: {e}")
+            opened = None
+        if opened is not None:
+            print(f"[SUCCESS] Camera opened with remembered backend {cached[0]} on index {cached[1]}")
+            return opened
+
+    status(f"Probing {len(candidates)} cameras")
+    lock = threading.Condition()
+    # Per candidate: None while probing, False if it failed, else (cap, actual_mode)
+    outcomes = [None] * len(candidates)
+    decided = []
+
+    def attempt(i, backend, index):
+        try:
+            opened = probe(backend, index, mode, capture_factory, timeout)
+        except Exception as e:
+            print(f"[ERROR] Camera backend {backend} index {index} failed: {e}")
+            opened = None
+        with lock:
+            if not decided:
+                outcomes[i] = opened or False
+                lock.notify_all()
+                return opened is not None
+        if opened is not None:
+            opened[0].release()
+        return True
+
+    def attempt_device(order):
+        for n, i in enumerate(order):
+            if attempt(i, *candidates[i]):
+                # The device is taken (or no longer wanted); its other backends lose
+                with lock:
+                    for j in order[n + 1:]:
+                        if outcomes[j] is None:
+                            outcomes[j] = False
+                    lock.notify_all()
+                return
+
+    def preferred():
+        # A candidate only wins once every one before it has failed;
+        # None while one of those is still probing, -1 if all failed
+        for i, outcome in enumerate(outcomes):
+            if outcome is None:
+                return None
+            if outcome:
+                return i
+        return -1
+
+    devices = {}
+    for i, (_, index) in enumerate(candidates):
+        devices.setdefault(max(index, 0), []).append(i)
+    for device, order in devices.items():
+        threading.Thread(target=attempt_device, args=(order,), name=f"probe-{device}", daemon=True).start()
+    deadline = time.monotonic() + timeout * max((len(order) for order in devices.values()), default=1) + 1.0
+    with lock:
+        choice = preferred()
+        while choice is None and time.monotonic() < deadline:
+            lock.wait(max(0.0, deadline - time.monotonic()))
+            choice = preferred()
+        if choice is None:
+            # Probes still running count as failed; late ones release their captures
+            choice = next((i for i, outcome in enumerate(outcomes) if outcome), -1)
+        decided.append(choice)
+        others = [outcome for i, outcome in enumerate(outcomes) if outcome and i != choice]
+
+    for cap, _ in others:
+        cap.release()
+    if choice < 0:
+        print("[ERROR] All camera initialization strategies failed")
+        return None
+    (backend, index), (cap, actual) = candidates[choice], outcomes[choice]
+    print(f"[SUCCESS] Camera opened with backend {backend} on index {index}")
+    if cache_path:
+        write_camera_cache(backend, index, cache_path)
+    return cap, actual
+
+
+def open_android_camera(mode=DEFAULT_MODE, **kwargs):
+    """Open Camera using multiple fallback strategies for Android."""
+    # Disable OpenCL and limit threads for stability
+    cv2.setNumThreads(1)
+    cv2.ocl.setUseOpenCL(False)
+
+    print("[INFO] Attempting to open Android camera...")
+    return open_camera(mode, ANDROID_CANDIDATES, **kwargs)
+
+
+class CameraOpener:
+    """Runs ``open_camera`` on a background thread.
+
+    The UI polls ``done`` and shows ``status``; ``result`` is then
+    ``(cap, actual_mode)`` or None. ``time_to_first_frame`` is the time from
+    ``start()`` until a camera delivered its first frame. ``cancel()``
+    releases a capture that is opened after nobody wants it any more.
+    """
+
+    def __init__(self, open_fn=open_camera, **kwargs):
+        self.open_fn = open_fn
+        self.kwargs = kwargs
+        self.status = "Starting camera"
+        self.result = None
+        self.error = None
+        self.started = None
+        self.time_to_first_frame = None
+        self.done = threading.Event()
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = time.monotonic()
+        threading.Thread(target=self._run, name="camera-open", daemon=True).start()
+        return self
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def _set_status(self, text):
+        self.status = text
+
+    def _run(self):
+        try:
+            result = self.open_fn(status=self._set_status, **self.kwargs)
+        except Exception as e:
+            self.error = e
+            result = None
+        with self._lock:
+            if result is not None:
+                self.time_to_first_frame = self.elapsed()
+                if self._cancelled:
+                    result[0].release()
+                    result = None
+            self.result = result
+            self.done.set()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            if self.result is not None:
+                self.result[0].release()
+                self.result = None
+
+
+# One rung of the quality ladder. pose_model is None (keep the analyzer's
+# own model) or a (path, input_size) pair for a smaller exported network.
+QualityLevel = namedtuple("QualityLevel", "mode fps pose_model")
+
+
+def quality_levels(mode, fps_steps=(20, 15), pose_models=(), resize=False, modes=CAMERA_MODES):
+    """Quality ladder starting at ``mode``, cheapest rung last.
+
+    Frame rate drops first, then the pose network is swapped for the
+    ``pose_models`` given (e.g. ``[("yolov8n-pose-320.onnx", 320)]``), and
+    only with ``resize`` does the camera drop to smaller modes of the same
+    aspect ratio: analyzers that calibrate in pixels must not see the frame
+    size change mid-test.
+    """
+    levels = [QualityLevel(mode, mode.fps, None)]
+    fps = mode.fps
+    for step in fps_steps:
+        if step < fps:
+            fps = step
+            levels.append(QualityLevel(mode, fps, None))
+    pose_model = None
+    for pose_model in pose_models:
+        levels.append(QualityLevel(mode, fps, tuple(pose_model)))
+    if resize:
+        for smaller in reversed(modes):
+            # Same aspect ratio only: another one changes what the analyzer sees
+            if (smaller.width * smaller.height < mode.width * mode.height
+                    and smaller.width * mode.height == smaller.height * mode.width):
+                levels.append(QualityLevel(smaller, fps, pose_model))
+    return levels
+
+
+class QualityGovernor:
+    """Steps quality down while frames run over budget, and back up with headroom.
+
+    ``update`` takes the analyzer time of every frame. Each ``window``
+    frames the median is compared with the frame budget (``budget`` seconds,
+    or one frame interval at the current level's fps): ``patience`` windows
+    over budget move one rung down ``levels``, ``recover`` windows under
+    ``headroom`` times the next rung up's budget move back up. Recovering is
+    slower than degrading so a hot device does not oscillate.
+    """
+
+    def __init__(self, levels, budget=None, window=30, headroom=0.6, patience=2, recover=4):
+        self.levels = levels
+        self.budget = budget
+        self.window = window
+        self.headroom = headroom
+        self.patience = patience
+        self.recover = recover
+        self.level = 0
+        self.samples = []
+        self.over = 0
+        self.under = 0
+        self.changes = 0
+
+    @property
+    def current(self):
+        return self.levels[self.level]
+
+    def frame_budget(self, level):
+        return self.budget or 1.0 / self.levels[level].fps
+
+    def update(self, frame_time):
+        """Returns the new QualityLevel when the level changes, else None."""
+        self.samples.append(frame_time)
+        if len(self.samples) < self.window:
+            return None
+        median = float(np.median(self.samples))
+        self.samples.clear()
+
+        if median > self.frame_budget(self.level):
+            self.over += 1
+            self.under = 0
+        elif self.level > 0 and median < self.headroom * self.frame_budget(self.level - 1):
+            self.under += 1
+            self.over = 0
+        else:
+            self.over = self.under = 0
+
+        if self.over >= self.patience and self.level < len(self.levels) - 1:
+            return self._step(1, median)
+        if self.under >= self.recover and self.level > 0:
+            return self._step(-1, median)
+        return None
+
+    def _step(self, direction, median):
+        self.level += direction
+        self.over = self.under = 0
+        self.changes += 1
+        level = self.current
+        print(f"[INFO] Quality {'down' if direction > 0 else 'up'} to level {self.level}: "
+              f"{level.mode.width}x{level.mode.height} @ {level.fps} fps, "
+              f"pose {level.pose_model or 'default'} (median frame {median * 1000:.0f} ms)")
+        return level
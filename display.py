@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+
+
+class FrameUploader:
+    """Uploads BGR frames into one reused texture per frame size.
+
+    ``texture_factory(size)`` creates a texture (``Texture.create`` in the
+    app, anything with ``blit_buffer``/``flip_vertical`` elsewhere). The
+    texture is only reallocated when the frame size changes. The vertical
+    flip Kivy needs (bottom-left origin) is done once in texture
+    coordinates, and frames are blitted straight from their own buffer, so
+    an upload costs no CPU-side copy.
+    """
+
+    def __init__(self, texture_factory):
+        self.texture_factory = texture_factory
+        self.texture = None
+        self.size = None
+
+        self.uploads = 0
+        self.allocations = 0
+        self.copies = 0
+        self.upload_time = 0.0
+
+    def upload(self, frame):
+        h, w = frame.shape[:2]
+        if self.texture is None or self.size != (w, h):
+            self.texture = self.texture_factory((w, h))
+            self.texture.flip_vertical()
+            self.size = (w, h)
+            self.allocations += 1
+
+        start = time.perf_counter()
+        if not frame.flags.c_contiguous:
+            # Only views (e.g. crops) need this; camera frames never do
+            frame = np.ascontiguousarray(frame)
+            self.copies += 1
+        self.texture.blit_buffer(memoryview(frame.reshape(-1)), colorfmt="bgr", bufferfmt="ubyte")
+        self.upload_time += time.perf_counter() - start
+        self.uploads += 1
+        return self.texture
+
+    def stats(self):
+        uploads = max(self.uploads, 1)
+        return {
+            "uploads": self.uploads,
+            "allocations_per_frame": self.allocations / uploads,
+            "copies_per_frame": self.copies / uploads,
+            "upload_ms": 1000.0 * self.upload_time / uploads,
+        }
@@ -1,3 +1,5 @@
+import os
+
 from ultralytics import YOLO
 
 # Load the YOLOv8 model
@@ -5,4 +7,14 @@ model = YOLO("yolov8n-pose.pt")
 
 # Export the model to ONNX format
 # opset=12 is widely supported by OpenCV
-model.export(format="onnx", opset=12)
+# imgsz must match YOLOv8Pose(input_size=...). Smaller (320/416/480) or
+# rectangular inputs such as [384, 640] (height, width) run much faster on
+# low-end phones. Export with dynamic=True to get a variable batch
+# dimension for infer_batch()
+
+# 320 input fallback the app's quality governor switches to when frames run
+# over budget (main.POSE_FALLBACK_MODELS). Exported first and renamed, as
+# every export is written to yolov8n-pose.onnx
+os.replace(model.export(format="onnx", opset=12, imgsz=320), "yolov8n-pose-320.onnx")
+
+model.export(format="onnx", opset=12, imgsz=640)
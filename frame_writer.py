@@ -0,0 +1,110 @@
+import json
+import os
+import queue
+import threading
+
+import cv2
+
+# cv2.imencode quality flag, default and valid range per format; PNG
+# takes a 0-9 compression level rather than a 0-100 quality
+QUALITY_FLAGS = {
+    "jpg": (cv2.IMWRITE_JPEG_QUALITY, 90, (0, 100)),
+    "png": (cv2.IMWRITE_PNG_COMPRESSION, 3, (0, 9)),
+    "webp": (cv2.IMWRITE_WEBP_QUALITY, 90, (1, 100)),
+}
+
+
+class FrameWriter:
+    """Saves evidence frames from a background thread.
+
+    ``save`` only queues the frame; encoding and disk I/O happen on a
+    worker thread, so the analyzer frame that asked for the snapshot is not
+    held up by them. When ``maxsize`` frames are already waiting, new ones
+    are dropped (and counted) rather than blocking. The worker starts on
+    demand and exits after ``idle`` seconds without work.
+
+    Each image can get a JSON sidecar next to it (same name, ``.json``)
+    with whatever metadata the analyzer passes, e.g. keypoints and the
+    measured value.
+    """
+
+    def __init__(self, directory, fmt="jpg", quality=None, maxsize=8, sidecar=True, idle=2.0):
+        if fmt not in QUALITY_FLAGS:
+            raise ValueError(f"Unsupported format {fmt!r}, expected one of {sorted(QUALITY_FLAGS)}")
+        self.directory = directory
+        self.fmt = fmt
+        # quality is in the format's own range; None picks its default
+        flag, default, (low, high) = QUALITY_FLAGS[fmt]
+        quality = default if quality is None else int(quality)
+        if not low <= quality <= high:
+            raise ValueError(f"{fmt} quality must be within {low}-{high}, got {quality}")
+        self.params = [flag, quality]
+        self.sidecar = sidecar
+        self.idle = idle
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, name, frame, meta=None, overlay=None):
+        """Queue ``frame`` to be written as ``name`` plus the format extension.
+
+        The writer keeps a reference to ``frame``, so pass a copy if it is
+        reused. ``overlay`` (an OverlaySnapshot) is drawn onto it on the
+        worker. Returns False if the queue was full and the frame dropped.
+        """
+        with self._lock:
+            try:
+                self._queue.put_nowait((name, frame, meta, overlay))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="frame-writer", daemon=True)
+                self._thread.start()
+        return True
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.{self.fmt}")
+
+    def flush(self):
+        """Block until every queued frame has been written."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.errors += 1
+                print(f"[ERROR] Could not save {item[0]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, name, frame, meta, overlay):
+        if overlay is not None:
+            overlay.render(frame)
+        ok, buf = cv2.imencode(f".{self.fmt}", frame, self.params)
+        if not ok:
+            raise IOError(f"{self.fmt} encoding failed")
+        path = self.path(name)
+        with open(path, "wb") as f:
+            f.write(buf.tobytes())
+        if self.sidecar and meta is not None:
+            with open(os.path.join(self.directory, f"{name}.json"), "w") as f:
+                json.dump(meta, f)
+        self.written += 1
+        print(f"Saved {path}")
@@ -1,44 +1,76 @@
 import cv2
-from yolo_onnx import YOLOv8Pose
-import os
+from yolo_onnx import get_pose_model, RoiPose
+from overlay import Overlay
+from frame_writer import FrameWriter
+from ring_buffer import MedianEstimate
+from camera import CameraMode
 import time
-import statistics
 from collections import deque
 
 class HeightEstimator:
-    def __init__(self):
-        # Use ONNX model
-        self.model = YOLOv8Pose("yolov8n-pose.onnx")
+    # The grid boxes and the grid-pixel to cm factor were tuned on 1280x720
+    # frames squashed into the grid; another mode changes the aspect ratio
+    # and field of view and with them the height, so the camera is held at
+    # this mode and never resized mid-test
+    CAMERA_MODE = CameraMode(1280, 720, 30)
+
+    # The alignment grid and the pixel-to-cm factor are defined in this space
+    GRID_SIZE = (700, 500)
+
+    def __init__(self, tolerance_cm=1.0, min_frames=15, max_frames=90, grace_frames=10, snapshots=True):
+        # Use ONNX model; the athlete stands ~3 m away and fills little of
+        # the frame, so infer on a crop around them once they are found
+        self.model = RoiPose(get_pose_model("yolov8n-pose.onnx"))
         self.height_buffer = deque(maxlen=10)
-        self.measurement_buffer = []
+        # Finishes once the median's 95% interval is within tolerance_cm,
+        # after at least min_frames aligned frames and at most max_frames
+        self.estimate = MedianEstimate(max_frames, min_frames, tolerance_cm)
         self.final_height = 0
+        self.final_halfwidth = None
         self.measurement_done = False
-        self.REQUIRED_FRAMES = 90
+        # Misaligned frames in a row tolerated before the measurement restarts
+        self.GRACE_FRAMES = grace_frames
+        self.misaligned = 0
         self.saved_count = 0
         self.max_saves = 3
+        self.SAVE_EVERY = 10
         self.save_dir = "captured_frames"
-        
-        if not os.path.exists(self.save_dir):
-            os.makedirs(self.save_dir)
+        # Snapshots are encoded and written off the measuring thread;
+        # snapshots=False (headless re-scoring) writes nothing at all
+        self.writer = FrameWriter(self.save_dir) if snapshots else None
+        # Set by SessionReader.replay: no snapshots of the blank replay frames
+        self.replaying = False
 
         # Grid definitions
         self.HEAD_BOX = (325, 40, 375, 110)
         self.TORSO_BOX = (300, 110, 400, 300)
         self.LEGS_BOX = (310, 300, 390, 450)
 
+        self.overlay = Overlay()
+
     def is_point_in_box(self, point, box):
         x, y = point
         bx1, by1, bx2, by2 = box
         return bx1 < x < bx2 and by1 < y < by2
 
-    def process_frame(self, img):
-        # Resize immediately to ensure consistency
-        img = cv2.resize(img, (700, 500))
-        results = self.model(img, verbose=False)
+    def process_frame(self, img, timestamp=None):
+        # The model letterboxes the camera frame itself; resizing it to the
+        # grid size first would only add a resample
+        return self.process_pose(img, self.model(img, verbose=False), timestamp)
+
+    def process_pose(self, img, results, timestamp=None):
+        # Keypoints are scaled into the grid space and the overlay is drawn
+        # in it; finish() scales the overlay back onto the frame
+        h, w = img.shape[:2]
+        gw, gh = self.GRID_SIZE
+        if (w, h) != (gw, gh):
+            results = results.scaled(gw / w, gh / h)
+        self.overlay.begin((gh, gw))
         
         grid_color = (0, 0, 255)
         aligned = False
         raw_height = 0
+        full_kpts = None
 
         if results.keypoints.data is not None:
             # Draw skeleton manually
@@ -46,7 +78,7 @@ class HeightEstimator:
             
             # Draw skeleton using our helper
             full_kpts = results.keypoints.data # Access the raw numpy array from Keypoints class
-            img = self.model.draw_skeleton(img, full_kpts)
+            self.overlay.skeleton(full_kpts)
             
             if len(kpts) >= 17:
                 nose = (int(kpts[0][0]), int(kpts[0][1]))
@@ -71,10 +103,10 @@ class HeightEstimator:
                 cx2, cy2 = int(kpts[2][0]), int(kpts[2][1])
                 cx1, cy1 = int(kpts[15][0]), int(kpts[15][1])
                 
-                cv2.circle(img, (cx2, cy2), 10, (255, 0, 0), cv2.FILLED)
-                cv2.circle(img, (cx1, cy1), 10, (255, 0, 0), cv2.FILLED)
+                self.overlay.circle((cx2, cy2), 10, (255, 0, 0), cv2.FILLED)
+                self.overlay.circle((cx1, cy1), 10, (255, 0, 0), cv2.FILLED)
                 
-                d = ((cx2 - cx1)**2 + (cy2 - cy1)**2)**0.5
+                d = ((kpts[2][0] - kpts[15][0])**2 + (kpts[2][1] - kpts[15][1])**2)**0.5
                 raw_height = (d * 0.5)
                 self.height_buffer.append(raw_height)
                 
@@ -82,53 +114,80 @@ class HeightEstimator:
                 di = round(avg_height)
                 
                 if not self.measurement_done:
-                    cv2.putText(img, f"Height: {di} cms", (40, 70), cv2.FONT_HERSHEY_DUPLEX, 1, (255, 255, 0), 2)
+                    self.overlay.text(f"Height: {di} cms", (40, 70), cv2.FONT_HERSHEY_DUPLEX, 1, (255, 255, 0), 2)
                 else:
-                    cv2.putText(img, f"Final Height: {round(self.final_height)} cms", (40, 70), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 255, 0), 2)
+                    self.overlay.text(f"Final Height: {round(self.final_height)} cms", (40, 70), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 255, 0), 2)
                     
-                cv2.putText(img, "Stand approx 3 meters away", (40, 450), cv2.FONT_HERSHEY_PLAIN, 2, (0, 0, 255), 2)
+                self.overlay.text("Stand approx 3 meters away", (40, 450), cv2.FONT_HERSHEY_PLAIN, 2, (0, 0, 255), 2)
 
         if aligned:
+            self.misaligned = 0
             if not self.measurement_done:
-                self.measurement_buffer.append(raw_height)
-                progress = min(100, int((len(self.measurement_buffer) / self.REQUIRED_FRAMES) * 100))
-                cv2.putText(img, f"Hold Still: {progress}%", (200, 200), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 255, 255), 2)
-                
-                if len(self.measurement_buffer) % 30 == 0 and self.saved_count < self.max_saves:
-                    filename = f"{self.save_dir}/capture_{int(time.time())}_{self.saved_count}.jpg"
-                    cv2.imwrite(filename, img)
+                self.estimate.append(raw_height)
+                progress = int(self.estimate.progress() * 100)
+                self.overlay.text(f"Hold Still: {progress}%", (200, 200), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 255, 255), 2)
+
+                converged = self.estimate.converged()
+                if ((len(self.estimate) % self.SAVE_EVERY == 0 or converged) and self.saved_count < self.max_saves
+                        and self.writer is not None and not self.replaying):
+                    name = f"capture_{int(time.time())}_{self.saved_count}"
+                    meta = {
+                        "time": time.time(),
+                        "raw_height_cm": round(raw_height, 2),
+                        "avg_height_cm": round(sum(self.height_buffer) / len(self.height_buffer), 2),
+                        "median_height_cm": round(self.estimate.median(), 2),
+                        "frames": len(self.estimate),
+                        "keypoints": full_kpts.round(2).tolist(),
+                    }
+                    self.writer.save(name, img.copy(), meta, overlay=self.overlay.snapshot())
                     self.saved_count += 1
-                    print(f"Saved {filename}")
-                
-                if len(self.measurement_buffer) >= self.REQUIRED_FRAMES:
-                    self.final_height = statistics.median(self.measurement_buffer)
+
+                if converged:
+                    self.final_height = self.estimate.median()
+                    self.final_halfwidth = self.estimate.halfwidth()
                     self.measurement_done = True
             else:
-                    cv2.putText(img, "Measurement Complete!", (200, 200), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 255, 0), 2)
-                    cv2.putText(img, f"Final: {round(self.final_height)} cm", (200, 250), cv2.FONT_HERSHEY_DUPLEX, 1.5, (0, 255, 0), 3)
+                    self.overlay.text("Measurement Complete!", (200, 200), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 255, 0), 2)
+                    self.overlay.text(f"Final: {round(self.final_height)} cm", (200, 250), cv2.FONT_HERSHEY_DUPLEX, 1.5, (0, 255, 0), 3)
         else:
-            if not self.measurement_done:
-                self.measurement_buffer = []
-                self.saved_count = 0
-            else:
-                self.measurement_buffer = []
+            # A blink of lost alignment (a missed keypoint, a sway) pauses
+            # the measurement; only a longer one starts over or, once
+            # done, readies the estimator for the next athlete
+            self.misaligned += 1
+            if self.misaligned > self.GRACE_FRAMES:
+                self.estimate.clear()
                 self.measurement_done = False
                 self.saved_count = 0
 
-        cv2.rectangle(img, (self.HEAD_BOX[0], self.HEAD_BOX[1]), (self.HEAD_BOX[2], self.HEAD_BOX[3]), grid_color, 2)
-        cv2.putText(img, "Head", (330, 35), cv2.FONT_HERSHEY_PLAIN, 1, grid_color, 1)
-        cv2.rectangle(img, (self.TORSO_BOX[0], self.TORSO_BOX[1]), (self.TORSO_BOX[2], self.TORSO_BOX[3]), grid_color, 2)
-        cv2.rectangle(img, (self.LEGS_BOX[0], self.LEGS_BOX[1]), (self.LEGS_BOX[2], self.LEGS_BOX[3]), grid_color, 2)
+        # Alignment grid (red/green) and floor guide never change shape,
+        # so they are rasterized once per colour and display size
+        self.overlay.static(("grid", grid_color), lambda layer: self.draw_grid(layer, grid_color))
+        self.overlay.static("floor", self.draw_floor)
+
+        return self.overlay.finish(img)
 
-        cv2.line(img, (0, 450), (700, 450), (200, 200, 200), 1)
-        cv2.line(img, (0, 480), (700, 480), (200, 200, 200), 1)
-        cv2.line(img, (250, 450), (200, 500), (200, 200, 200), 1)
-        cv2.line(img, (450, 450), (500, 500), (200, 200, 200), 1)
-        cv2.line(img, (350, 450), (350, 500), (200, 200, 200), 1)
+    def draw_grid(self, layer, grid_color):
+        layer.rect((self.HEAD_BOX[0], self.HEAD_BOX[1]), (self.HEAD_BOX[2], self.HEAD_BOX[3]), grid_color, 2)
+        layer.text("Head", (330, 35), cv2.FONT_HERSHEY_PLAIN, 1, grid_color, 1)
+        layer.rect((self.TORSO_BOX[0], self.TORSO_BOX[1]), (self.TORSO_BOX[2], self.TORSO_BOX[3]), grid_color, 2)
+        layer.rect((self.LEGS_BOX[0], self.LEGS_BOX[1]), (self.LEGS_BOX[2], self.LEGS_BOX[3]), grid_color, 2)
 
-        return img
+    def draw_floor(self, layer):
+        layer.line((0, 450), (700, 450), (200, 200, 200), 1)
+        layer.line((0, 480), (700, 480), (200, 200, 200), 1)
+        layer.line((250, 450), (200, 500), (200, 200, 200), 1)
+        layer.line((450, 450), (500, 500), (200, 200, 200), 1)
+        layer.line((350, 450), (350, 500), (200, 200, 200), 1)
 
     def get_height(self):
         if self.measurement_done:
             return self.final_height
         return None
+
+    def summary(self):
+        done = self.measurement_done
+        return {
+            "height_cm": self.get_height(),
+            "height_ci_cm": self.final_halfwidth if done else None,
+            "frames": len(self.estimate) if done else None,
+        }
@@ -0,0 +1,127 @@
+"""Lightweight live performance counters.
+
+Code on the hot path checks ``instr.enabled`` before timing anything, so
+leaving the instrumentation off costs one attribute lookup per stage.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+class RollingHistogram:
+    """The last ``size`` samples of a latency, in a preallocated ring."""
+
+    def __init__(self, size=256):
+        self.samples = np.zeros(size)
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.count % len(self.samples)] = value
+        self.count += 1
+
+    def values(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def summary(self):
+        values = self.values() * 1000.0
+        if values.size == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            "count": self.count,
+            "mean_ms": round(float(values.mean()), 2),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+        }
+
+
+class RateMeter:
+    """Events per second over the last ``size`` events."""
+
+    def __init__(self, size=64):
+        self.times = np.zeros(size)
+        self.count = 0
+
+    def tick(self, now):
+        self.times[self.count % len(self.times)] = now
+        self.count += 1
+
+    def rate(self):
+        n = min(self.count, len(self.times))
+        if n < 2:
+            return 0.0
+        newest = self.times[(self.count - 1) % len(self.times)]
+        oldest = self.times[self.count % len(self.times)] if self.count > len(self.times) else self.times[0]
+        return (n - 1) / (newest - oldest) if newest > oldest else 0.0
+
+
+class Instrumentation:
+    """Rolling stage latencies, rates and counters, plus user hooks.
+
+    ``record(stage, seconds)`` feeds a latency histogram and every hook
+    added with ``add_hook`` (called as ``hook(stage, seconds)``);
+    ``tick(name)`` feeds a rate meter; ``count(name)`` bumps a counter.
+    """
+
+    def __init__(self, window=256):
+        self.enabled = False
+        self.window = window
+        self.hooks = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = defaultdict(lambda: RollingHistogram(self.window))
+            self.rates = defaultdict(RateMeter)
+            self.counters = defaultdict(int)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.stages[stage].add(seconds)
+        for hook in self.hooks:
+            hook(stage, seconds)
+
+    def tick(self, name):
+        with self._lock:
+            self.rates[name].tick(time.perf_counter())
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "time": time.time(),
+                "stages": {name: hist.summary() for name, hist in self.stages.items()},
+                "fps": {name: round(meter.rate(), 1) for name, meter in self.rates.items()},
+                "counters": dict(self.counters),
+            }
+
+    def dump(self, path):
+        """Append the current snapshot as one JSON line to ``path``."""
+        with open(path, "a") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+    def hud_text(self):
+        """Short multi-line summary for the on-screen HUD."""
+        snap = self.snapshot()
+        lines = [" ".join(f"{name} {fps:.0f}fps" for name, fps in sorted(snap["fps"].items()))]
+        for name, stats in sorted(snap["stages"].items()):
+            if stats["count"]:
+                lines.append(f"{name}: {stats['p50_ms']:.1f} / {stats['p95_ms']:.1f} ms")
+        if snap["counters"]:
+            lines.append(" ".join(f"{name}={n}" for name, n in sorted(snap["counters"].items())))
+        return "\n".join(lines)
+
+
+# Process-wide instance; off until the app (or a script) enables it
+instr = Instrumentation()
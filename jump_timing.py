@@ -0,0 +1,59 @@
+"""Time-based helpers for the jump analyzers.
+
+Frames reach the analyzers at an uneven rate (dropped frames, skipped or
+adaptive inference), so events are located in time by interpolating
+between samples rather than taken from whichever frame happened to arrive.
+"""
+import time
+
+import numpy as np
+
+G_CM_S2 = 981.0
+
+
+def frame_time(timestamp):
+    """The capture timestamp, or now if the caller did not provide one."""
+    return time.monotonic() if timestamp is None else timestamp
+
+
+def crossing(t0, v0, t1, v1, level):
+    """Time, and the interpolation fraction, at which a value going v0 -> v1 crosses ``level``."""
+    if v1 == v0:
+        return t1, 1.0
+    frac = min(1.0, max(0.0, (level - v0) / (v1 - v0)))
+    return t0 + frac * (t1 - t0), frac
+
+
+def ballistic_peak(ts, ys):
+    """Peak (smallest image y) of a flight phase sampled at uneven times.
+
+    Fits y = a t^2 + b t + c to the samples, since a body in free flight
+    follows a parabola, and returns ``(t_peak, y_peak)``. Falls back to the
+    highest sample when there are too few samples or the fit is not a
+    downward-opening (in image coordinates, a > 0) parabola inside the
+    sampled interval.
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    best = int(np.argmin(ys))
+    if len(ts) < 3 or np.ptp(ts) <= 0:
+        return ts[best], ys[best]
+    t0 = ts[0]
+    a, b, c = np.polyfit(ts - t0, ys, 2)
+    if a <= 0:
+        return ts[best], ys[best]
+    t_peak = -b / (2 * a)
+    if not 0.0 <= t_peak <= ts[-1] - t0:
+        return ts[best], ys[best]
+    # Never report a peak lower than one that was actually observed
+    return t0 + t_peak, min(c - b * b / (4 * a), ys[best])
+
+
+def flight_height_cm(flight_s):
+    """Jump height implied by flight time for a take-off and landing at the same height: g t^2 / 8."""
+    return G_CM_S2 * flight_s ** 2 / 8.0
+
+
+def flight_time_s(height_cm):
+    """Floor-to-floor flight time of a jump of ``height_cm``."""
+    return np.sqrt(8.0 * height_cm / G_CM_S2)
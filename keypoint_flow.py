@@ -0,0 +1,162 @@
+import cv2
+import numpy as np
+
+from instrumentation import instr
+from yolo_onnx import Results
+
+# Attributes analyzers keep their pose model in
+POSE_ATTRS = ("model", "pose_model")
+
+
+class FlowPose:
+    """Runs the pose network every k frames and tracks keypoints in between.
+
+    Between inferences the keypoints are moved with pyramidal Lucas-Kanade
+    optical flow on a half-resolution grey frame; points the flow loses fall
+    back to a constant-velocity prediction and their confidence decays. k adapts after every inference:
+    fast motion or low confidence drops it to 1, quiet holds raise it up to
+    ``max_interval``.
+
+    Wraps any model returning ``Results`` and delegates everything else to
+    it, so analyzers use it exactly like ``YOLOv8Pose``.
+    """
+
+    def __init__(self, model, max_interval=4, fast_motion=0.03, slow_motion=0.008,
+                 min_conf=0.5, conf_decay=0.9, flow_scale=0.5):
+        self.model = model
+        self.max_interval = max_interval
+        # Per-frame keypoint motion as a fraction of the person's box diagonal
+        self.fast_motion = fast_motion
+        self.slow_motion = slow_motion
+        self.min_conf = min_conf
+        self.conf_decay = conf_decay
+        self.flow_scale = flow_scale
+        self.lk_params = dict(winSize=(15, 15), maxLevel=3,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+        self.interval = 1
+        self.since_inference = 0
+        self.prev_gray = None
+        self.last = None
+        self.velocity = None
+        self.last_inferred = None
+
+        self.inferences = 0
+        self.propagated = 0
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __call__(self, img, verbose=False, **kwargs):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if self.flow_scale != 1.0:
+            gray = cv2.resize(gray, None, fx=self.flow_scale, fy=self.flow_scale, interpolation=cv2.INTER_AREA)
+
+        results = None
+        if self._can_propagate(gray):
+            results = self._propagate(gray)
+        if results is None:
+            results = self._infer(img, **kwargs)
+
+        self.prev_gray = gray
+        self.last = results
+        return results
+
+    def _can_propagate(self, gray):
+        return (self.since_inference < self.interval
+                and self.last is not None
+                and self.last.keypoints.data is not None
+                and self.prev_gray is not None
+                and self.prev_gray.shape == gray.shape)
+
+    def _infer(self, img, **kwargs):
+        results = self.model(img, **kwargs)
+        self.inferences += 1
+        if instr.enabled:
+            instr.count("inferences")
+        self._adapt(results)
+        self.since_inference = 1
+        self.last_inferred = results
+        return results
+
+    def _adapt(self, results):
+        people = results.keypoints.people
+        previous = self.last_inferred
+        if people is None or previous is None or previous.keypoints.people is None:
+            self.interval = 1
+            self.velocity = None
+            return
+
+        # Compare against the previous *inferred* best person
+        cur, prev = people[0], previous.keypoints.people[0]
+        seen = (cur[:, 2] > self.min_conf) & (prev[:, 2] > self.min_conf)
+        if np.count_nonzero(seen) < 4 or np.mean(cur[:, 2]) < self.min_conf:
+            self.interval = 1
+            self.velocity = None
+            return
+
+        steps = max(self.since_inference, 1)
+        if previous.keypoints.people.shape == people.shape:
+            self.velocity = (people[..., :2] - previous.keypoints.people[..., :2]) / steps
+        else:
+            self.velocity = None
+
+        box = results.boxes[0]
+        size = max(np.hypot(box[2] - box[0], box[3] - box[1]), 1.0)
+        motion = np.median(np.linalg.norm(cur[seen, :2] - prev[seen, :2], axis=1)) / steps / size
+
+        if motion > self.fast_motion:
+            self.interval = 1
+        elif motion < self.slow_motion:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+    def _propagate(self, gray):
+        last = self.last
+        people = last.keypoints.people.copy()
+        pts = (people[..., :2].reshape(-1, 1, 2) * self.flow_scale).astype(np.float32)
+
+        new_pts, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, pts, None, **self.lk_params)
+        tracked = status.reshape(people.shape[:2]).astype(bool)
+        if np.count_nonzero(tracked[0] & (people[0, :, 2] > self.min_conf)) < 4:
+            # Flow lost the athlete, run the network instead
+            return None
+
+        moved = new_pts.reshape(people.shape[0], 17, 2) / self.flow_scale
+        if self.velocity is not None and self.velocity.shape == moved.shape:
+            predicted = people[..., :2] + self.velocity
+        else:
+            predicted = people[..., :2]
+        people[..., :2] = np.where(tracked[..., np.newaxis], moved, predicted)
+        # Tracked points keep their inferred confidence, so a quiet hold does
+        # not fade joints under the analyzers' thresholds; only the
+        # predicted ones lose confidence each frame
+        people[..., 2] = np.where(tracked, people[..., 2], people[..., 2] * self.conf_decay)
+
+        boxes = last.boxes.copy()
+        shift = np.mean(people[..., :2] - last.keypoints.people[..., :2], axis=1)
+        boxes[:, [0, 2]] += shift[:, :1]
+        boxes[:, [1, 3]] += shift[:, 1:]
+
+        results = Results(people[0], boxes, last.scores, people)
+        results.ids = last.ids
+        self.since_inference += 1
+        self.propagated += 1
+        if instr.enabled:
+            instr.count("inferences_skipped")
+        return results
+
+    def reset(self):
+        self.last = None
+        self.last_inferred = None
+        self.prev_gray = None
+        self.velocity = None
+        self.interval = 1
+
+
+def attach(processor, **options):
+    """Route an analyzer's pose model through a FlowPose, in place."""
+    for name in POSE_ATTRS:
+        model = getattr(processor, name, None)
+        if model is not None and not isinstance(model, FlowPose):
+            setattr(processor, name, FlowPose(model, **options))
+    return processor
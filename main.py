@@ -1,15 +1,20 @@
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
+from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.label import Label
 from kivy.uix.image import Image
 from kivy.clock import Clock
 from kivy.graphics.texture import Texture
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.core.window import Window
+from kivy.metrics import Metrics
 from kivy.utils import platform
 
-import cv2
+import os
+import threading
+import time
+
 import numpy as np
 
 # Your analyzers (unchanged)
@@ -19,74 +24,43 @@ from situp_counter import SitUpCounter
 from broad_jump import BroadJumpAnalyzer
 from vertical_jump import VerticalJumpAnalyzer
 from sit_reach_box import SitReachBoxAnalyzer
+from station import Station
+from yolo_onnx import YOLOv8Pose, YOLOv8Detect, registry
+import keypoint_flow
+import session_log
+from pipeline import CameraPipeline
+from display import FrameUploader
+from camera import CameraOpener, open_camera, open_android_camera, pick_mode, quality_levels, QualityGovernor
+from instrumentation import instr
 
 GLOBAL_USER_HEIGHT = 170
 
+# Performance snapshots are appended here when the stats HUD is on
+PERF_SNAPSHOT_FILE = "perf_snapshots.jsonl"
 
-# ================================================
-#  FIXED ANDROID CAMERA OPEN FUNCTION
-# ================================================
-def open_android_camera():
-    """Open Camera using multiple fallback strategies for Android."""
-    import time
-    
-    # Disable OpenCL and limit threads for stability
-    cv2.setNumThreads(1)
-    cv2.ocl.setUseOpenCL(False)
-    
-    print("[INFO] Attempting to open Android camera...")
-    
-    # Strategy 1: Try CAP_ANDROID backend with different indices
-    for idx in [0, 1, -1]:
-        try:
-            print(f"[INFO] Trying CAP_ANDROID backend with index {idx}")
-            cap = cv2.VideoCapture(idx, cv2.CAP_ANDROID)
-            time.sleep(0.5)  # Give camera time to initialize
-            
-            if cap.isOpened():
-                # Test if we can actually read a frame
-                ret, frame = cap.read()
-                if ret and frame is not None:
-                    print(f"[SUCCESS] Camera opened with CAP_ANDROID on index {idx}")
-                    # Set optimal parameters
-                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-                    cap.set(cv2.CAP_PROP_FPS, 30)
-                    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                    return cap
-                else:
-                    print(f"[WARN] Camera opened but cannot read frames on index {idx}")
-                    cap.release()
-            else:
-                cap.release()
-        except Exception as e:
-            print(f"[ERROR] CAP_ANDROID index {idx} failed: {e}")
-    
-    # Strategy 2: Try default backend
-    for idx in [0, 1]:
-        try:
-            print(f"[INFO] Trying default backend with index {idx}")
-            cap = cv2.VideoCapture(idx)
-            time.sleep(0.5)
-            
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret and frame is not None:
-                    print(f"[SUCCESS] Camera opened with default backend on index {idx}")
-                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-                    cap.set(cv2.CAP_PROP_FPS, 30)
-                    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                    return cap
-                else:
-                    cap.release()
-            else:
-                cap.release()
-        except Exception as e:
-            print(f"[ERROR] Default backend index {idx} failed: {e}")
-    
-    print("[ERROR] All camera initialization strategies failed")
-    return None
+# Every session's keypoints are logged here for later re-scoring
+SESSION_DIR = "sessions"
+
+# Models every test needs; loaded in the background at app start so the
+# first menu tap does not pay for parsing the ONNX file
+WARMUP_MODELS = [
+    (YOLOv8Pose, "yolov8n-pose.onnx", {}),
+    (YOLOv8Detect, "sitreach.onnx", {}),
+]
+
+# Input size the pose models were exported at; the camera mode is picked
+# to just cover it
+POSE_INPUT_SIZE = 640
+
+# Cheaper pose exports (path, input size) the quality governor falls back
+# to on a slow device, if they were shipped (see export_model.py)
+POSE_FALLBACK_MODELS = [("yolov8n-pose-320.onnx", 320)]
+
+# Share of the camera screen's height taken by the button bar
+BAR_HEIGHT = 0.1
+
+# Seconds to wait for the camera permission dialog before giving up
+PERMISSION_TIMEOUT = 10.0
 
 
 # ================================================
@@ -104,9 +78,11 @@ class MenuScreen(Screen):
             ("Height Measurement", self.go_to_height),
             ("Sit and Reach (Side)", self.go_to_reach),
             ("Sit-Up Counter", self.go_to_situps),
+            ("Sit-Ups: Group", self.go_to_situps_group),
             ("Broad Jump", self.go_to_broad),
             ("Vertical Jump", self.go_to_vertical),
             ("Sit and Reach (Box)", self.go_to_reach_box),
+            ("Station: Height + Sit-Ups", self.go_to_station),
         ]
 
         for txt, func in buttons:
@@ -117,27 +93,38 @@ class MenuScreen(Screen):
         self.add_widget(layout)
 
     def go_to_height(self, inst):
-        self.manager.get_screen("camera").start_camera(HeightEstimator())
+        self.manager.get_screen("camera").start_camera(HeightEstimator, mode=HeightEstimator.CAMERA_MODE)
         self.manager.current = "camera"
 
     def go_to_reach(self, inst):
-        self.manager.get_screen("camera").start_camera(ReachTestAnalyzer())
+        self.manager.get_screen("camera").start_camera(ReachTestAnalyzer)
         self.manager.current = "camera"
 
     def go_to_situps(self, inst):
-        self.manager.get_screen("camera").start_camera(SitUpCounter())
+        self.manager.get_screen("camera").start_camera(SitUpCounter)
+        self.manager.current = "camera"
+
+    def go_to_situps_group(self, inst):
+        self.manager.get_screen("camera").start_camera(lambda: SitUpCounter(group=True))
         self.manager.current = "camera"
 
     def go_to_broad(self, inst):
-        self.manager.get_screen("camera").start_camera(BroadJumpAnalyzer(user_height_cm=GLOBAL_USER_HEIGHT))
+        self.manager.get_screen("camera").start_camera(lambda: BroadJumpAnalyzer(user_height_cm=GLOBAL_USER_HEIGHT))
         self.manager.current = "camera"
 
     def go_to_vertical(self, inst):
-        self.manager.get_screen("camera").start_camera(VerticalJumpAnalyzer(user_height_cm=GLOBAL_USER_HEIGHT))
+        self.manager.get_screen("camera").start_camera(lambda: VerticalJumpAnalyzer(user_height_cm=GLOBAL_USER_HEIGHT))
         self.manager.current = "camera"
 
     def go_to_reach_box(self, inst):
-        self.manager.get_screen("camera").start_camera(SitReachBoxAnalyzer())
+        self.manager.get_screen("camera").start_camera(SitReachBoxAnalyzer)
+        self.manager.current = "camera"
+
+    def go_to_station(self, inst):
+        # Both tests share one pose inference per frame
+        self.manager.get_screen("camera").start_camera(
+            lambda: Station({"height": HeightEstimator(), "situps": SitUpCounter()}),
+            mode=HeightEstimator.CAMERA_MODE)
         self.manager.current = "camera"
 
 
@@ -153,98 +140,238 @@ class CameraScreen(Screen):
 
         self.layout.add_widget(self.img_widget)
 
-        back = Button(text="Back to Menu", size_hint=(1, 0.1), background_color=(1, 0, 0, 1))
+        bar = BoxLayout(orientation="horizontal", size_hint=(1, BAR_HEIGHT))
+        back = Button(text="Back to Menu", background_color=(1, 0, 0, 1))
         back.bind(on_press=self.stop_camera)
-        self.layout.add_widget(back)
+        bar.add_widget(back)
+        stats = ToggleButton(text="Stats", size_hint=(0.25, 1))
+        stats.bind(state=self.toggle_hud)
+        bar.add_widget(stats)
+        self.layout.add_widget(bar)
+        self.hud_event = None
 
         self.add_widget(self.layout)
 
         self.capture = None
         self.processor = None
+        self.pipeline = None
         self.event = None
-
-    def start_camera(self, processor):
-        """Start camera with permission checks and retry logic."""
+        self.opener = None
+        self.wait_event = None
+        self.session_log = None
+        self.uploader = FrameUploader(lambda size: Texture.create(size=size, colorfmt="bgr"))
+
+    def start_camera(self, make_processor, mode=None):
+        """Open the camera and build the analyzer in the background, then start the pipeline.
+
+        ``make_processor`` builds the analyzer; it runs on a worker thread
+        so a model that is still warming up loads while the camera opens.
+        ``mode`` pins the camera mode for tests calibrated to one. The UI
+        only polls for progress and never blocks.
+        """
         print("[INFO] Starting camera…")
-        self.processor = processor
-        
-        # Check permissions on Android
-        if platform == "android":
-            app = App.get_running_app()
-            
-            # Wait a bit for permissions to be processed
-            from time import sleep
-            sleep(0.5)
-            
-            if not app.permissions_granted:
+        self.hide_error()
+        self.show_progress("Starting camera…")
+        self.started = time.monotonic()
+        # Ask for the smallest camera mode that still covers the model input
+        # and the area it is shown in, instead of decoding pixels only to
+        # throw them away
+        self.mode = mode or pick_mode(POSE_INPUT_SIZE, self.shown_size())
+
+        loaded = self.loaded = {}
+
+        def load():
+            try:
+                # Run the network every few frames and track keypoints in between
+                loaded["processor"] = keypoint_flow.attach(make_processor())
+            except Exception as e:
+                loaded["error"] = e
+        threading.Thread(target=load, name="analyzer-load", daemon=True).start()
+
+        self.opener = None
+        self.wait_event = Clock.schedule_interval(self.poll_startup, 0.1)
+
+    def poll_startup(self, dt):
+        elapsed = time.monotonic() - self.started
+
+        if self.opener is None:
+            # Permission dialogs answer asynchronously; wait for them
+            # without blocking instead of sleeping on the UI thread
+            if platform == "android" and not App.get_running_app().permissions_granted:
+                if elapsed < PERMISSION_TIMEOUT:
+                    self.show_progress(f"Waiting for camera permission… {elapsed:.1f} s")
+                    return
                 print("[ERROR] Camera permissions not granted")
-                self.show_error("Camera permission required.\nPlease grant permission and restart the app.")
+                self.fail_startup("Camera permission required.\nPlease grant permission and restart the app.")
                 return
-        
-        # Try to open camera
-        if platform == "android":
-            self.capture = open_android_camera()
-        else:
-            self.capture = cv2.VideoCapture(0)
+            open_fn = open_android_camera if platform == "android" else open_camera
+            self.opener = CameraOpener(open_fn, mode=self.mode).start()
 
-        if not self.capture or not self.capture.isOpened():
+        if not self.opener.done.is_set():
+            self.show_progress(f"{self.opener.status}… {elapsed:.1f} s")
+            return
+        if not self.loaded:
+            self.show_progress(f"Loading model… {elapsed:.1f} s")
+            return
+
+        self.wait_event.cancel()
+        self.wait_event = None
+        self.hide_progress()
+        if "error" in self.loaded:
+            print(f"[ERROR] Analyzer failed to load: {self.loaded['error']}")
+            self.fail_startup("Model could not be loaded.")
+            return
+        if self.opener.result is None:
             print("[ERROR] Camera unavailable.")
-            self.show_error("Camera could not be opened.\nTry:\n1. Restart the app\n2. Check camera permissions\n3. Close other camera apps")
+            self.fail_startup("Camera could not be opened.\nTry:\n1. Restart the app\n2. Check camera permissions\n3. Close other camera apps")
             return
 
-        print("[INFO] Camera opened successfully!")
-        self.hide_error()
+        self.capture, mode = self.opener.result
+        if mode[:2] != self.mode[:2]:
+            print(f"[WARN] Asked the camera for {self.mode.width}x{self.mode.height}, "
+                  f"got {mode.width}x{mode.height}")
+        ttff = self.opener.time_to_first_frame
+        self.opener = None
+        self.processor = self.loaded["processor"]
+        name = f"{type(self.processor).__name__}_{int(time.time())}.kplog"
+        self.session_log = session_log.SessionLog(os.path.join(SESSION_DIR, name),
+                                                  max_people=getattr(self.processor, "max_people", 1))
+        session_log.attach(self.processor, self.session_log)
+        print(f"[INFO] Camera opened successfully! First frame after {ttff:.2f} s, "
+              f"ready after {elapsed:.2f} s")
+        if instr.enabled:
+            instr.record("camera_open", ttff)
+
+        # Capture and analysis run on worker threads; the UI only renders.
+        # Overlays are drawn at the widget's size, not camera resolution.
+        # Drop fps, then the pose input size, (and, for tests that do not
+        # measure in pixels, resolution) when frames run over budget on a
+        # slow or hot device
+        pose_models = [m for m in POSE_FALLBACK_MODELS if os.path.exists(m[0])]
+        levels = quality_levels(mode, pose_models=pose_models,
+                                resize=getattr(self.processor, "scale_invariant", False))
+        self.pipeline = CameraPipeline(self.capture, self.processor, display_size=self.display_size(),
+                                       governor=QualityGovernor(levels))
+        self.pipeline.start()
         self.event = Clock.schedule_interval(self.update, 1/30)
 
+    def fail_startup(self, text):
+        if self.wait_event:
+            self.wait_event.cancel()
+            self.wait_event = None
+        self.hide_progress()
+        self.show_error(text)
+
+    def shown_size(self):
+        """Area the camera image is shown in, in density-independent pixels.
+
+        The camera screen may not be laid out yet when the mode is picked,
+        so this is the window minus the button bar. A frame stretched over
+        a high-density screen loses no visible detail, so physical pixels
+        would only ask for a larger mode than the eye can use.
+        """
+        w, h = Window.size
+        return (w / Metrics.density, h * (1 - BAR_HEIGHT) / Metrics.density)
+
+    def display_size(self):
+        return (int(self.img_widget.width), int(self.img_widget.height))
+
+    def on_size(self, *args):
+        if self.pipeline:
+            self.pipeline.display_size = self.display_size()
+
     # -------------------------
     def stop_camera(self, *args):
         if self.event:
             self.event.cancel()
 
+        if self.wait_event:
+            self.wait_event.cancel()
+            self.wait_event = None
+        if self.opener:
+            # Releases the camera if it finishes opening after we left
+            self.opener.cancel()
+            self.opener = None
+        self.hide_progress()
+        self.hide_error()
+
+        if self.pipeline:
+            self.pipeline.stop()
+
+        if instr.enabled:
+            instr.dump(PERF_SNAPSHOT_FILE)
+
+        if self.session_log:
+            self.session_log.close()
+            self.session_log = None
+
         if self.capture:
             self.capture.release()
 
         self.capture = None
         self.processor = None
+        self.pipeline = None
         self.manager.current = "menu"
 
     # -------------------------
     def update(self, dt):
         global GLOBAL_USER_HEIGHT
 
-        if not self.capture:
+        if not self.pipeline:
             return
 
-        ret, frame = self.capture.read()
-        if not ret or frame is None:
-            print("[WARN] Empty or invalid frame.")
+        # Newest analyzed frame; None if the analyzer has not finished one
+        # since the last tick, in which case the old texture stays up
+        packet = self.pipeline.latest()
+        if packet is None:
             return
-        
-        # Validate frame has valid dimensions
-        if frame.shape[0] == 0 or frame.shape[1] == 0:
-            print("[WARN] Frame has invalid dimensions.")
-            return
-
-        # Apply your analyzer
-        if self.processor:
-            try:
-                frame = self.processor.process_frame(frame)
-            except Exception as e:
-                print(f"[ERROR] Frame processing failed: {e}")
-                return
-
-            # update global height from height estimator
-            if isinstance(self.processor, HeightEstimator):
-                result = self.processor.get_height()
+        frame = packet.frame
+        start = time.perf_counter()
+
+        # update global height from height estimator
+        analyzers = getattr(self.processor, "analyzers", {"": self.processor})
+        for analyzer in analyzers.values():
+            if isinstance(analyzer, HeightEstimator):
+                result = analyzer.get_height()
                 if result:
                     GLOBAL_USER_HEIGHT = result
 
-        # Kivy uses bottom-left origin → flip vertically
-        frame = cv2.flip(frame, 0)
+        # Same texture every frame unless the size changes; the uploader
+        # flips it in texture coordinates (Kivy uses bottom-left origin)
+        texture = self.uploader.upload(frame)
+        if self.img_widget.texture is not texture:
+            self.img_widget.texture = texture
+        else:
+            self.img_widget.canvas.ask_update()
+
+        if instr.enabled:
+            instr.record("upload", time.perf_counter() - start)
+            instr.record("display_latency", time.monotonic() - packet.timestamp)
+            instr.tick("display")
 
-        texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt="bgr")
-        texture.blit_buffer(frame.tobytes(), colorfmt="bgr", bufferfmt="ubyte")
-        self.img_widget.texture = texture
+    # -------------------------
+    def toggle_hud(self, button, state):
+        """Show live stage timings and counters over the camera view."""
+        if state == "down":
+            instr.reset()
+            instr.enabled = True
+            self.hud_lbl = Label(text="", font_size=14, size_hint=(1, 0.2), halign="left", valign="top")
+            self.hud_lbl.bind(size=self.hud_lbl.setter("text_size"))
+            self.layout.add_widget(self.hud_lbl, index=len(self.layout.children))
+            self.hud_event = Clock.schedule_interval(self.update_hud, 0.5)
+        else:
+            instr.dump(PERF_SNAPSHOT_FILE)
+            instr.enabled = False
+            if self.hud_event:
+                self.hud_event.cancel()
+                self.hud_event = None
+            if hasattr(self, "hud_lbl"):
+                self.layout.remove_widget(self.hud_lbl)
+                del self.hud_lbl
+
+    def update_hud(self, dt):
+        if hasattr(self, "hud_lbl"):
+            self.hud_lbl.text = instr.hud_text()
 
     # -------------------------
     def show_error(self, text):
@@ -257,6 +384,18 @@ class CameraScreen(Screen):
             self.layout.remove_widget(self.error_lbl)
             del self.error_lbl
 
+    def show_progress(self, text):
+        if hasattr(self, "progress_lbl"):
+            self.progress_lbl.text = text
+            return
+        self.progress_lbl = Label(text=text, font_size=24, size_hint=(1, 0.1))
+        self.layout.add_widget(self.progress_lbl)
+
+    def hide_progress(self):
+        if hasattr(self, "progress_lbl"):
+            self.layout.remove_widget(self.progress_lbl)
+            del self.progress_lbl
+
 
 # ================================================
 #  MAIN APP
@@ -275,6 +414,8 @@ class FitnessApp(App):
 
     def on_start(self):
         """Request permissions when app starts."""
+        registry.warmup_async(WARMUP_MODELS)
+
         if platform == "android":
             from android.permissions import request_permissions, Permission, check_permission
             
@@ -295,6 +436,14 @@ class FitnessApp(App):
             # On desktop, permissions are not needed
             self.permissions_granted = True
     
+    def on_pause(self):
+        # Free model memory while in the background; warmed up again on resume
+        registry.clear()
+        return True
+
+    def on_resume(self):
+        registry.warmup_async(WARMUP_MODELS)
+
     def permission_callback(self, permissions, grant_results):
         """Callback when permissions are granted or denied."""
         if all(grant_results):
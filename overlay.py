@@ -0,0 +1,170 @@
+import cv2
+import numpy as np
+
+from yolo_onnx import draw_pose
+
+
+class Overlay:
+    """Drawing primitives an analyzer produces for one frame.
+
+    Analyzers record text, lines, boxes, circles and skeletons here instead
+    of drawing into the camera frame. Parts that never change (grids, floor
+    lines, labels) go into named static layers, which are rasterized once
+    per display size and then composited with a single indexed copy.
+    Everything is drawn at whatever resolution the frame is shown at, with
+    coordinates scaled from the analyzer's frame size.
+
+    ``render_on_frame`` keeps the old behaviour: ``finish`` draws straight
+    into the analyzed frame. The app turns it off and renders snapshots at
+    display resolution instead.
+    """
+
+    def __init__(self):
+        self.render_on_frame = True
+        self._static_defs = {}
+        self._static_cache = {}
+        self.begin((0, 0))
+
+    def begin(self, shape):
+        """Start a new frame; ``shape`` is the analyzed frame's shape."""
+        self.size = (shape[1], shape[0])
+        self.items = []
+        self.layers = []
+
+    # --- primitives (frame coordinates) ---
+    def text(self, text, org, font, scale, color, thickness=1, line_type=cv2.LINE_8):
+        self.items.append(("text", text, org, font, scale, color, thickness, line_type))
+
+    def line(self, p1, p2, color, thickness=1):
+        self.items.append(("line", p1, p2, color, thickness))
+
+    def rect(self, p1, p2, color, thickness=1):
+        self.items.append(("rect", p1, p2, color, thickness))
+
+    def circle(self, center, radius, color, thickness=1):
+        self.items.append(("circle", center, radius, color, thickness))
+
+    def skeleton(self, kpts):
+        self.items.append(("skeleton", np.array(kpts, copy=True)))
+
+    def static(self, key, build):
+        """Show static layer ``key``; ``build(layer)`` records its primitives once."""
+        if key not in self._static_defs:
+            layer = Overlay()
+            build(layer)
+            self._static_defs[key] = layer.items
+        self.layers.append(key)
+
+    # --- rendering ---
+    def snapshot(self):
+        """Frozen copy of this frame's overlay, safe to render on another thread."""
+        # Lists are copied so a mid-frame snapshot misses later additions
+        return OverlaySnapshot(self, self.size, list(self.items), list(self.layers))
+
+    def finish(self, frame):
+        if self.render_on_frame:
+            self.snapshot().render(frame)
+        return frame
+
+    def _static_layer(self, key, size, scale):
+        # Pixels the layer covers, as flat indices, and their colours
+        cached = self._static_cache.get((key, size))
+        if cached is None:
+            canvas = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+            alpha = np.zeros((size[1], size[0]), dtype=np.uint8)
+            for item in self._static_defs[key]:
+                draw_item(canvas, item, scale)
+                draw_item(alpha, item, scale, color=255)
+            idx = np.flatnonzero(alpha)
+            cached = (idx, canvas.reshape(-1, 3)[idx])
+            self._static_cache[(key, size)] = cached
+        return cached
+
+
+class OverlaySnapshot:
+    def __init__(self, overlay, size, items, layers):
+        self.overlay = overlay
+        self.size = size
+        self.items = items
+        self.layers = layers
+
+    def render(self, img):
+        h, w = img.shape[:2]
+        scale = (w / self.size[0], h / self.size[1]) if self.size[0] else (1.0, 1.0)
+        flat = img.reshape(-1, 3)
+        for key in self.layers:
+            idx, colors = self.overlay._static_layer(key, (w, h), scale)
+            flat[idx] = colors
+        for item in self.items:
+            draw_item(img, item, scale)
+        return img
+
+
+class OverlayGroup:
+    """The overlays of several analyzers, drawn together (see station.py).
+
+    Member overlays never draw into the frame themselves; the group's own
+    ``render_on_frame`` decides whether ``finish`` draws all of them.
+    """
+
+    def __init__(self, overlays):
+        self.overlays = list(overlays)
+        for overlay in self.overlays:
+            overlay.render_on_frame = False
+        self.render_on_frame = True
+
+    def snapshot(self):
+        return SnapshotGroup([overlay.snapshot() for overlay in self.overlays])
+
+    def finish(self, frame):
+        if self.render_on_frame:
+            self.snapshot().render(frame)
+        return frame
+
+
+class SnapshotGroup:
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+
+    def render(self, img):
+        for snapshot in self.snapshots:
+            snapshot.render(img)
+        return img
+
+
+def _pt(p, scale):
+    return (int(round(p[0] * scale[0])), int(round(p[1] * scale[1])))
+
+
+def draw_item(img, item, scale=(1.0, 1.0), color=None):
+    """Draw one recorded primitive; ``color`` overrides it (used for alpha masks)."""
+    kind = item[0]
+    s = min(scale)
+    if kind == "text":
+        _, text, org, font, font_scale, c, thickness, line_type = item
+        cv2.putText(img, text, _pt(org, scale), font, font_scale * s, color or c,
+                    max(1, int(round(thickness * s))), line_type)
+    elif kind == "line":
+        _, p1, p2, c, thickness = item
+        cv2.line(img, _pt(p1, scale), _pt(p2, scale), color or c, max(1, int(round(thickness * s))))
+    elif kind == "rect":
+        _, p1, p2, c, thickness = item
+        cv2.rectangle(img, _pt(p1, scale), _pt(p2, scale), color or c,
+                      thickness if thickness < 0 else max(1, int(round(thickness * s))))
+    elif kind == "circle":
+        _, center, radius, c, thickness = item
+        cv2.circle(img, _pt(center, scale), max(1, int(round(radius * s))), color or c,
+                   thickness if thickness < 0 else max(1, int(round(thickness * s))))
+    elif kind == "skeleton":
+        draw_pose(img, item[1], scale=scale)
+
+
+def fit_to_display(frame, display_size):
+    """Downscale ``frame`` to fit ``display_size`` (w, h), keeping its aspect ratio."""
+    if not display_size:
+        return frame
+    h, w = frame.shape[:2]
+    ratio = min(display_size[0] / w, display_size[1] / h)
+    if ratio >= 1.0:
+        return frame
+    return cv2.resize(frame, (max(1, int(w * ratio)), max(1, int(h * ratio))), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,237 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+from camera import apply_mode
+from instrumentation import instr
+from keypoint_flow import POSE_ATTRS
+from overlay import fit_to_display
+from yolo_onnx import YOLOv8Pose, get_pose_model
+
+# One captured frame travelling through the pipeline. timestamp is
+# time.monotonic() at capture, so every stage can tell how old it is.
+Packet = namedtuple("Packet", "index timestamp frame")
+
+
+class LatestQueue:
+    """Bounded queue where new items push out the oldest unread ones.
+
+    A slow consumer therefore always gets the freshest data instead of a
+    growing backlog. ``dropped`` counts items that were never read.
+    """
+
+    def __init__(self, maxsize=1):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        """Queue ``item``; returns True if an unread item was dropped for it."""
+        with self._cond:
+            dropped = len(self._items) == self._items.maxlen
+            if dropped:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """Oldest unread item, or None on timeout or once closed."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def get_nowait(self):
+        with self._cond:
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def swap_pose_model(processor, model):
+    """Put ``model`` behind ``processor``'s pose wrappers; returns the model it replaced."""
+    for attr in POSE_ATTRS:
+        holder, name = processor, attr
+        current = vars(holder).get(name)
+        # Walk FlowPose / RoiPose wrappers down to the network itself
+        while current is not None and not isinstance(current, YOLOv8Pose):
+            holder, name = current, "model"
+            current = vars(holder).get(name)
+        if current is None:
+            continue
+        if vars(holder).get("roi_model") is current:
+            holder.roi_model = model
+        setattr(holder, name, model)
+        return current
+    return None
+
+
+class CameraPipeline:
+    """Capture -> analyzer -> display, each stage on its own thread.
+
+    A capture thread reads the camera as fast as it delivers frames, an
+    analyzer worker runs ``processor.process_frame`` on the newest one and
+    the UI thread picks up finished frames with ``latest()``. Stages are
+    joined by latest-frame-wins queues, and frames older than ``max_age``
+    seconds when the worker gets to them are dropped rather than processed
+    late, so a slow model lowers the analyzed frame rate but never adds lag.
+
+    With a ``governor`` (camera.QualityGovernor) the analyzer time of every
+    frame decides the quality level: the capture thread paces frames to the
+    level's fps and switches camera mode, and the analyzer swaps in the
+    level's pose model between frames.
+    """
+
+    def __init__(self, capture, processor, max_age=0.2, display_size=None, governor=None):
+        self.capture = capture
+        self.processor = processor
+        self.max_age = max_age
+        # (w, h) frames are shown at; analyzer overlays are drawn at this
+        # size rather than camera resolution. Updated by the UI on resize.
+        self.display_size = display_size
+        self.overlay = getattr(processor, "overlay", None)
+        if self.overlay is not None:
+            self.overlay.render_on_frame = False
+
+        self.governor = governor
+        self.frame_interval = 0.0
+        self._mode = None
+        self._pending_mode = None
+        self._default_pose = None
+        if governor is not None:
+            self._mode = governor.current.mode
+            self.frame_interval = 1.0 / governor.current.fps
+
+        self.frames = LatestQueue(1)
+        self.results = LatestQueue(1)
+        self._running = False
+        self._threads = []
+
+        self.captured = 0
+        self.invalid = 0
+        self.stale = 0
+        self.errors = 0
+
+    def start(self):
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._analyze_loop, name="analyzer", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._running = False
+        self.frames.close()
+        self.results.close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        self._threads = []
+
+    def latest(self):
+        """Newest analyzed Packet for display, or None if nothing new."""
+        return self.results.get_nowait()
+
+    def _capture_loop(self):
+        next_due = 0.0
+        while self._running:
+            mode = self._pending_mode
+            if mode is not None:
+                # Only this thread touches the capture, so switch modes here
+                self._pending_mode = None
+                apply_mode(self.capture, mode)
+            ret, frame = self.capture.read()
+            timestamp = time.monotonic()
+            if not ret or frame is None or frame.shape[0] == 0 or frame.shape[1] == 0:
+                self.invalid += 1
+                if instr.enabled:
+                    instr.count("invalid_frames")
+                time.sleep(0.005)
+                continue
+            # Pace to the quality level's fps on a fixed schedule, with some
+            # slack for jitter, so a 30 fps camera at 20 fps passes two frames
+            # in three rather than every other one
+            interval = self.frame_interval
+            if timestamp < next_due - interval * 0.1:
+                continue
+            # After a stall, restart the schedule instead of catching up in a burst
+            next_due = max(next_due, timestamp - interval) + interval
+            dropped = self.frames.put(Packet(self.captured, timestamp, frame))
+            self.captured += 1
+            if instr.enabled:
+                instr.tick("capture")
+                if dropped:
+                    instr.count("dropped_frames")
+
+    def _analyze_loop(self):
+        while self._running:
+            packet = self.frames.get(timeout=0.1)
+            if packet is None:
+                continue
+            if time.monotonic() - packet.timestamp > self.max_age:
+                self.stale += 1
+                if instr.enabled:
+                    instr.count("stale_frames")
+                continue
+
+            start = time.perf_counter()
+            frame = packet.frame
+            if self.processor:
+                try:
+                    # Capture time, so analyzers measure real time between frames
+                    frame = self.processor.process_frame(frame, packet.timestamp)
+                except Exception as e:
+                    self.errors += 1
+                    if instr.enabled:
+                        instr.count("analyzer_errors")
+                    print(f"[ERROR] Frame processing failed: {e}")
+                    continue
+            analyzed = time.perf_counter()
+            if self.governor is not None:
+                level = self.governor.update(analyzed - start)
+                if level is not None:
+                    self._apply_level(level)
+
+            frame = fit_to_display(frame, self.display_size)
+            if self.overlay is not None:
+                self.overlay.snapshot().render(frame)
+
+            if instr.enabled:
+                instr.record("process_frame", analyzed - start)
+                instr.record("draw", time.perf_counter() - analyzed)
+                instr.record("latency", time.monotonic() - packet.timestamp)
+                instr.tick("analyzed")
+
+            self.results.put(packet._replace(frame=frame))
+
+    def _apply_level(self, level):
+        if instr.enabled:
+            instr.count("quality_changes")
+        self.frame_interval = 1.0 / level.fps
+        mode = level.mode._replace(fps=level.fps)
+        if mode != self._mode:
+            self._mode = self._pending_mode = mode
+
+        if level.pose_model is None:
+            if self._default_pose is not None:
+                swap_pose_model(self.processor, self._default_pose)
+                self._default_pose = None
+            return
+        try:
+            path, input_size = level.pose_model
+            replaced = swap_pose_model(self.processor, get_pose_model(path, input_size=input_size))
+        except Exception as e:
+            print(f"[WARN] Could not switch pose model: {e}")
+            return
+        if self._default_pose is None:
+            self._default_pose = replaced
@@ -1,12 +1,12 @@
 import cv2
-from yolo_onnx import YOLOv8Pose
+from yolo_onnx import get_pose_model
+from overlay import Overlay
+from ring_buffer import KeypointRing, RollingStats
 import numpy as np
-from collections import deque
-import statistics
 
 class ReachTestAnalyzer:
     def __init__(self, real_height_cm=170):
-        self.model = YOLOv8Pose('yolov8n-pose.onnx')
+        self.model = get_pose_model('yolov8n-pose.onnx')
         self.REAL_HEIGHT_CM = real_height_cm
         
         # --- PHYSICS ---
@@ -15,8 +15,10 @@ class ReachTestAnalyzer:
         self.HAND_OFFSET_CM = 18.0 
         
         # --- BUFFERS ---
-        self.kps_buffer = deque(maxlen=10) 
-        self.ankle_history = deque(maxlen=45)
+        # Running per-joint means over the last 10 frames and running
+        # stdev of the ankle x over the last 45, both O(1) per frame
+        self.kps_buffer = KeypointRing(10)
+        self.ankle_history = RollingStats(45)
         
         # --- STATE ---
         self.state = "WAITING_FOR_POSE" 
@@ -33,28 +35,28 @@ class ReachTestAnalyzer:
         self.current_attempt_max = -999.0  
         self.last_locked_score = 0.0    
 
-    def get_avg_point(self, kps_list, idx):
-        pts = []
-        for k in kps_list:
-            if k[idx][2] > 0.5:
-                pts.append(k[idx][:2]) # Only x,y
-        if not pts: return None
-        return np.mean(pts, axis=0)
+        self.overlay = Overlay()
+
+    def get_avg_point(self, idx):
+        # Mean x,y of the frames where this joint was confident
+        return self.kps_buffer.mean(idx)
 
     def check_stability(self):
-        if len(self.ankle_history) < 45: return False
-        xs = [p[0] for p in self.ankle_history]
-        return statistics.stdev(xs) < 5.0
+        if not self.ankle_history.full(): return False
+        return self.ankle_history.std() < 5.0
+
+    def process_frame(self, frame, timestamp=None):
+        return self.process_pose(frame, self.model(frame, verbose=False), timestamp)
 
-    def process_frame(self, frame):
-        results = self.model(frame, verbose=False)
+    def process_pose(self, frame, results, timestamp=None):
+        self.overlay.begin(frame.shape)
         
         if results.keypoints.data is not None:
             # Access raw data (17, 3)
             raw_kps = results.keypoints.data
             self.kps_buffer.append(raw_kps)
             
-            if len(self.kps_buffer) < 5: return frame
+            if len(self.kps_buffer) < 5: return self.overlay.finish(frame)
 
             # 1. SIDE SELECTION (LOCK IT ONCE CALIBRATED)
             if self.locked_side is None:
@@ -66,25 +68,25 @@ class ReachTestAnalyzer:
 
             # 2. EXTRACT POINTS BASED ON SIDE
             if active_side == 'left':
-                knee = self.get_avg_point(self.kps_buffer, 13)
-                ankle = self.get_avg_point(self.kps_buffer, 15)
-                hip = self.get_avg_point(self.kps_buffer, 11)
-                wrist = self.get_avg_point(self.kps_buffer, 9)
+                knee = self.get_avg_point(13)
+                ankle = self.get_avg_point(15)
+                hip = self.get_avg_point(11)
+                wrist = self.get_avg_point(9)
                 raw_wrist_tensor = raw_kps[9] 
             else:
-                knee = self.get_avg_point(self.kps_buffer, 14)
-                ankle = self.get_avg_point(self.kps_buffer, 16)
-                hip = self.get_avg_point(self.kps_buffer, 12)
-                wrist = self.get_avg_point(self.kps_buffer, 10)
+                knee = self.get_avg_point(14)
+                ankle = self.get_avg_point(16)
+                hip = self.get_avg_point(12)
+                wrist = self.get_avg_point(10)
                 raw_wrist_tensor = raw_kps[10]
 
-            if knee is None or ankle is None or hip is None: return frame
-            self.ankle_history.append(ankle)
+            if knee is None or ankle is None or hip is None: return self.overlay.finish(frame)
+            self.ankle_history.append(ankle[0])
 
             # --- PHASE 1: CALIBRATION ---
             if self.state == "WAITING_FOR_POSE":
-                cv2.putText(frame, "HANDS ON KNEES TO START", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 165, 255), 2)
-                cv2.circle(frame, tuple(knee.astype(int)), 40, (0, 165, 255), 2)
+                self.overlay.text("HANDS ON KNEES TO START", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 165, 255), 2)
+                self.overlay.circle(tuple(knee.astype(int)), 40, (0, 165, 255), 2)
                 
                 is_stable = self.check_stability()
                 hands_on_knees = False
@@ -110,7 +112,7 @@ class ReachTestAnalyzer:
             # --- PHASE 2: DEBUG MEASUREMENT ---
             elif self.state == "LOCKED":
                 # Draw Static Red Line
-                cv2.line(frame, (self.frozen_toe_x, 0), (self.frozen_toe_x, frame.shape[0]), (0, 0, 255), 3)
+                self.overlay.line((self.frozen_toe_x, 0), (self.frozen_toe_x, frame.shape[0]), (0, 0, 255), 3)
                 
                 # EXTRACT WRIST DATA
                 wrist_conf = float(raw_wrist_tensor[2])
@@ -129,14 +131,14 @@ class ReachTestAnalyzer:
                     dot_color = (0, 255, 255) # Yellow
                     if raw_cm > 0: dot_color = (0, 255, 0) # Green
                         
-                    cv2.circle(frame, (int(wrist_x), int(wrist_y)), 10, dot_color, -1)
-                    cv2.line(frame, (int(wrist_x), int(wrist_y)), (self.frozen_toe_x, int(wrist_y)), dot_color, 1)
+                    self.overlay.circle((int(wrist_x), int(wrist_y)), 10, dot_color, -1)
+                    self.overlay.line((int(wrist_x), int(wrist_y)), (self.frozen_toe_x, int(wrist_y)), dot_color, 1)
                     
                     # DEBUG TEXT: Show raw value always
-                    cv2.putText(frame, f"RAW: {raw_cm:.1f} cm", (int(wrist_x), int(wrist_y)-30), 
+                    self.overlay.text(f"RAW: {raw_cm:.1f} cm", (int(wrist_x), int(wrist_y)-30), 
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.6, dot_color, 2)
                 else:
-                    cv2.putText(frame, "LOST HAND TRACKING", (50, 250), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                    self.overlay.text("LOST HAND TRACKING", (50, 250), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
 
                 # LOGIC UPDATE (Without strict positive gate)
                 if raw_cm > -900: # If valid detection
@@ -158,10 +160,17 @@ class ReachTestAnalyzer:
                             self.attempt_state = "IDLE"
                             self.current_attempt_max = -999.0
 
-                # SCOREBOARD
-                cv2.rectangle(frame, (20, 80), (350, 200), (0, 0, 0), -1)
-                cv2.putText(frame, f"LAST: {self.last_locked_score:.1f} cm", (30, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2)
+                # SCOREBOARD (the black panel is static)
+                self.overlay.static("scoreboard", lambda layer: layer.rect((20, 80), (350, 200), (0, 0, 0), -1))
+                self.overlay.text(f"LAST: {self.last_locked_score:.1f} cm", (30, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2)
                 best_color = (0, 215, 255) if self.global_best_reach > 0 else (0, 0, 255)
-                cv2.putText(frame, f"BEST: {self.global_best_reach:.1f} cm", (30, 170), cv2.FONT_HERSHEY_SIMPLEX, 1.2, best_color, 3)
+                self.overlay.text(f"BEST: {self.global_best_reach:.1f} cm", (30, 170), cv2.FONT_HERSHEY_SIMPLEX, 1.2, best_color, 3)
+
+        return self.overlay.finish(frame)
 
-        return frame
+    def summary(self):
+        return {
+            "best_reach_cm": self.global_best_reach if self.global_best_reach > -999 else None,
+            "last_reach_cm": self.last_locked_score,
+            "side": self.locked_side,
+        }
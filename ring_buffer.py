@@ -0,0 +1,197 @@
+import numpy as np
+
+
+class KeypointRing:
+    """The last ``capacity`` (17, 3) keypoint frames in a preallocated ring.
+
+    Keeps a per-joint sum and count of the points whose confidence is over
+    ``conf``, so the confidence-masked mean of any joint over the window
+    costs O(1) per frame instead of a pass over the history. Sums are
+    recomputed exactly once per lap of the ring so rounding cannot drift.
+    """
+
+    def __init__(self, capacity=10, num_kpts=17, conf=0.5):
+        self.capacity = capacity
+        self.conf = conf
+        self.data = np.zeros((capacity, num_kpts, 3))
+        self.mask = np.zeros((capacity, num_kpts), dtype=bool)
+        self.sum = np.zeros((num_kpts, 2))
+        self.count = np.zeros(num_kpts, dtype=np.int64)
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def full(self):
+        return self.size == self.capacity
+
+    def append(self, kpts):
+        slot = self.head
+        if self.size == self.capacity:
+            # Take the frame being overwritten out of the running sums
+            self.sum -= self.data[slot, :, :2] * self.mask[slot, :, np.newaxis]
+            self.count -= self.mask[slot]
+        else:
+            self.size += 1
+        self.data[slot] = kpts
+        self.mask[slot] = kpts[:, 2] > self.conf
+        self.sum += self.data[slot, :, :2] * self.mask[slot, :, np.newaxis]
+        self.count += self.mask[slot]
+
+        self.head = (slot + 1) % self.capacity
+        if self.head == 0:
+            self.sum = (self.data[..., :2] * self.mask[..., np.newaxis]).sum(axis=0)
+
+    def mean(self, idx):
+        """Mean (x, y) of joint ``idx`` over the confident frames, or None if there are none."""
+        if self.count[idx] == 0:
+            return None
+        return self.sum[idx] / self.count[idx]
+
+    def means(self):
+        """(num_kpts, 2) means; NaN for joints never confidently seen in the window."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sum / self.count[:, np.newaxis]
+
+    def latest(self):
+        return self.data[(self.head - 1) % self.capacity] if self.size else None
+
+    def clear(self):
+        self.sum[:] = 0
+        self.count[:] = 0
+        self.mask[:] = False
+        self.head = 0
+        self.size = 0
+
+
+class RollingStats:
+    """Sliding-window mean and variance of scalars or fixed-shape vectors.
+
+    Values live in a preallocated ring; the mean and sum of squared
+    deviations are updated with Welford's method, including the sliding
+    form that swaps the oldest value for the newest, so both cost O(1) per
+    update. ``std`` is the sample standard deviation (like statistics.stdev).
+    """
+
+    def __init__(self, capacity, shape=()):
+        self.capacity = capacity
+        self.buffer = np.zeros((capacity,) + tuple(shape))
+        self._mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def full(self):
+        return self.size == self.capacity
+
+    def append(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        slot = self.head
+        if self.size < self.capacity:
+            self.size += 1
+            delta = value - self._mean
+            self._mean = self._mean + delta / self.size
+            self._m2 = self._m2 + delta * (value - self._mean)
+        else:
+            old = self.buffer[slot].copy()
+            mean = self._mean + (value - old) / self.size
+            self._m2 = self._m2 + (value - old) * (value - mean + old - self._mean)
+            self._mean = mean
+        self.buffer[slot] = value
+        self.head = (slot + 1) % self.capacity
+        if self.head == 0:
+            # Once per lap, recompute from the values so rounding cannot drift
+            self._mean = self.buffer.mean(axis=0)
+            self._m2 = ((self.buffer - self._mean) ** 2).sum(axis=0)
+
+    def mean(self):
+        return self._mean if self.size else None
+
+    def var(self):
+        if self.size < 2:
+            return None
+        return np.maximum(self._m2, 0.0) / (self.size - 1)
+
+    def std(self):
+        var = self.var()
+        return None if var is None else np.sqrt(var)
+
+    def values(self):
+        """Values in the window (in ring order, not arrival order)."""
+        return self.buffer[:self.size]
+
+    def median(self):
+        return np.median(self.values(), axis=0) if self.size else None
+
+    def clear(self):
+        self._mean = np.zeros_like(self._mean)
+        self._m2 = np.zeros_like(self._m2)
+        self.head = 0
+        self.size = 0
+
+
+class MedianEstimate:
+    """Streaming median with a confidence interval, for a value held still.
+
+    Samples go into a preallocated buffer of up to ``capacity``. The spread
+    is the MAD scaled to a standard deviation (1.4826), so a few bad
+    keypoint frames barely move it, and the interval half-width is
+    ``z * 1.2533 * sigma / sqrt(n)`` (the standard error of a median).
+    ``converged`` once at least ``min_samples`` are in and the half-width is
+    within ``tolerance``, or when the buffer is full.
+    """
+
+    def __init__(self, capacity=90, min_samples=15, tolerance=1.0, z=1.96):
+        self.capacity = capacity
+        self.min_samples = min_samples
+        self.tolerance = tolerance
+        self.z = z
+        self.buffer = np.zeros(capacity)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, value):
+        if self.size < self.capacity:
+            self.buffer[self.size] = value
+            self.size += 1
+
+    def values(self):
+        return self.buffer[:self.size]
+
+    def median(self):
+        return float(np.median(self.values())) if self.size else None
+
+    def sigma(self):
+        if self.size < 2:
+            return None
+        values = self.values()
+        return 1.4826 * float(np.median(np.abs(values - np.median(values))))
+
+    def halfwidth(self):
+        sigma = self.sigma()
+        if sigma is None:
+            return None
+        return float(self.z * 1.2533 * sigma / np.sqrt(self.size))
+
+    def converged(self):
+        if self.size >= self.capacity:
+            return True
+        halfwidth = self.halfwidth()
+        return self.size >= self.min_samples and halfwidth is not None and halfwidth <= self.tolerance
+
+    def progress(self):
+        """0..1, how close the estimate is to converging (for a progress bar)."""
+        if self.converged():
+            return 1.0
+        halfwidth = self.halfwidth()
+        closeness = 0.0 if halfwidth is None else min(1.0, self.tolerance / max(halfwidth, 1e-9))
+        return max(self.size / self.capacity, min(self.size / self.min_samples, 1.0) * closeness)
+
+    def clear(self):
+        self.size = 0
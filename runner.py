@@ -0,0 +1,250 @@
+"""Run any analyzer on a video file or an image directory, without Kivy.
+
+    python runner.py situps session.mp4
+    python runner.py height captured_frames/ --fps 10 --output result.json
+    python runner.py height+situps session.mp4    # one inference, both tests
+
+Prints (or writes) a JSON report with the analyzer's final scores and
+per-stage fps/latency statistics.
+"""
+import argparse
+import contextlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import keypoint_flow
+import session_log
+from height_estimator import HeightEstimator
+from reach_test import ReachTestAnalyzer
+from situp_counter import SitUpCounter
+from broad_jump import BroadJumpAnalyzer
+from vertical_jump import VerticalJumpAnalyzer
+from sit_reach_box import SitReachBoxAnalyzer
+from station import Station
+
+# Test name -> factory taking the athlete's height in cm
+ANALYZERS = {
+    # Offline re-scoring must not write snapshots next to (or into) its input
+    "height": lambda height_cm: HeightEstimator(snapshots=False),
+    "reach": lambda height_cm: ReachTestAnalyzer(real_height_cm=height_cm),
+    "situps": lambda height_cm: SitUpCounter(),
+    "situps-group": lambda height_cm: SitUpCounter(group=True),
+    "broad": lambda height_cm: BroadJumpAnalyzer(user_height_cm=height_cm),
+    "vertical": lambda height_cm: VerticalJumpAnalyzer(user_height_cm=height_cm),
+    "box": lambda height_cm: SitReachBoxAnalyzer(),
+}
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def test_name(value):
+    """argparse type for a test name, or several joined with + for a shared-inference station."""
+    names = value.split("+")
+    for name in names:
+        if name not in ANALYZERS:
+            raise argparse.ArgumentTypeError(f"unknown test {name!r}, expected one of {', '.join(sorted(ANALYZERS))}")
+    return value
+
+
+def make_processor(test, height_cm=170):
+    """One analyzer, or a Station running several (``"height+situps"``) off one inference."""
+    if "+" not in test:
+        return ANALYZERS[test](height_cm)
+    return Station({name: ANALYZERS[name](height_cm) for name in test.split("+")})
+
+
+def quiet_stdout():
+    """Send what analyzers print (progress) to stderr, keeping stdout clean for a JSON report."""
+    return contextlib.redirect_stdout(sys.stderr)
+
+
+def latency_stats(samples):
+    """fps and p50/p95/p99/mean latency in ms for a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(samples),
+        "fps": round(1000.0 / ms.mean(), 2) if ms.mean() > 0 else None,
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+    }
+
+
+def iter_frames(source, fps=30.0):
+    """Yield ``(timestamp_s, frame, decode_s)`` from a video file or image directory."""
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTS))
+        for i, name in enumerate(names):
+            start = time.perf_counter()
+            frame = cv2.imread(os.path.join(source, name))
+            elapsed = time.perf_counter() - start
+            if frame is not None:
+                yield i / fps, frame, elapsed
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open {source}")
+    try:
+        while True:
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            elapsed = time.perf_counter() - start
+            if not ret or frame is None:
+                break
+            yield cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame, elapsed
+    finally:
+        cap.release()
+
+
+class Prefetcher:
+    """Decodes frames on a background thread, a bounded number ahead.
+
+    ``close`` stops the thread and closes the frame generator (releasing
+    its VideoCapture) even when the consumer stops early or raises.
+    """
+
+    _DONE = object()
+
+    def __init__(self, frames, depth=8, timeout=0.1):
+        self._queue = queue.Queue(maxsize=depth)
+        self._timeout = timeout
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(frames,), name="decode", daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # Never block for good on a full queue nobody reads any more
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=self._timeout)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, frames):
+        try:
+            for item in frames:
+                if not self._put(item):
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            # Runs the generator's own finally (cap.release) on this thread
+            if hasattr(frames, "close"):
+                frames.close()
+            self._put(self._DONE)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def close(self, timeout=2.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+def run(test, source, height_cm=170, fps=30.0, max_frames=None, render=False, flow=False, record=None):
+    """Run one analyzer over ``source`` and return the JSON-ready report."""
+    processor = make_processor(test, height_cm)
+    if flow:
+        keypoint_flow.attach(processor)
+    log = None
+    if record:
+        log = session_log.SessionLog(record, max_people=getattr(processor, "max_people", 1))
+        session_log.attach(processor, log)
+    overlay = getattr(processor, "overlay", None)
+    if overlay is not None:
+        # Headless runs only need the scores, unless drawing cost is wanted too
+        overlay.render_on_frame = render
+
+    decode_times, wait_times, analyze_times = [], [], []
+    frames = 0
+    start = time.perf_counter()
+    waited = time.perf_counter()
+    prefetcher = Prefetcher(iter_frames(source, fps))
+    try:
+        for timestamp, frame, decode_s in prefetcher:
+            t0 = time.perf_counter()
+            wait_times.append(t0 - waited)
+            processor.process_frame(frame, timestamp)
+            waited = time.perf_counter()
+            analyze_times.append(waited - t0)
+            decode_times.append(decode_s)
+            frames += 1
+            if max_frames and frames >= max_frames:
+                break
+    finally:
+        prefetcher.close()
+        if log is not None:
+            log.close()
+    wall = time.perf_counter() - start
+
+    report = {
+        "test": test,
+        "source": source,
+        "frames": frames,
+        "wall_s": round(wall, 3),
+        "fps": round(frames / wall, 2) if wall > 0 else None,
+        "result": processor.summary(),
+        "stages": {
+            "decode": latency_stats(decode_times),
+            "decode_wait": latency_stats(wait_times),
+            "analyze": latency_stats(analyze_times),
+        },
+    }
+    for attr in keypoint_flow.POSE_ATTRS:
+        model = getattr(processor, attr, None)
+        if isinstance(model, keypoint_flow.FlowPose):
+            report["inference"] = {"inferred": model.inferences, "propagated": model.propagated}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fitness test analyzer on recorded frames.")
+    parser.add_argument("test", type=test_name, help=f"one of {', '.join(sorted(ANALYZERS))}, or several joined with +")
+    parser.add_argument("source", help="video file or directory of images")
+    parser.add_argument("--height", type=float, default=170, help="athlete height in cm")
+    parser.add_argument("--fps", type=float, default=30.0, help="frame rate assumed for image directories")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--render", action="store_true", help="also draw the overlay on every frame")
+    parser.add_argument("--flow", action="store_true", help="track keypoints between inferences like the app")
+    parser.add_argument("--record", help="also write the keypoint session log here")
+    parser.add_argument("--threads", type=int, default=None, help="cv2.setNumThreads budget")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    with quiet_stdout():
+        report = run(args.test, args.source, args.height, args.fps, args.max_frames, args.render, args.flow,
+                     args.record)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
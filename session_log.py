@@ -0,0 +1,245 @@
+"""Append-only binary log of the keypoints an analyzer saw, and its replay.
+
+    python session_log.py situps sessions/SitUpCounter_1760000000.kplog
+
+A log is a small JSON header followed by fixed-width records, one per
+analyzed frame: its capture timestamp, the frame size, and the box,
+score and (17, 3) keypoints of up to ``max_people`` people, plus the
+reference object an analyzer measures against (the sit-and-reach box).
+Pixel coordinates are float32, confidences and scores float16, so a
+record is about 200 bytes per person (a 10-minute, 30 fps session is
+~3.6 MB). ``SessionReader`` memory-maps the records and feeds them
+straight into an analyzer's ``process_pose``, with detectors and
+snapshots off, so re-scoring needs no inference and writes nothing.
+"""
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from yolo_onnx import Results
+
+MAGIC = b"KPLOG\x00\x01\x00"
+VERSION = 2
+
+
+def record_dtype(max_people=1, version=VERSION):
+    fields = [
+        ("t", "<f8"),                        # capture timestamp, s (else since the log was opened)
+        ("size", "<u2", (2,)),               # w, h of the analyzed frame
+        ("n", "u1"),                         # people present, 0..max_people
+        ("box", "<f4", (max_people, 4)),     # x1, y1, x2, y2
+        ("score", "<f2", (max_people,)),
+        ("xy", "<f4", (max_people, 17, 2)),
+        ("conf", "<f2", (max_people, 17)),
+    ]
+    if version >= 2:
+        fields += [
+            ("ref_box", "<f4", (4,)),        # reference object (the sit-and-reach box), NaN if none
+            ("ref_scale", "<f4"),            # its pixels per cm, NaN if none
+        ]
+    return np.dtype(fields)
+
+
+def analyzers(processor):
+    """The analyzers behind ``processor``: a Station's members, or itself."""
+    members = getattr(processor, "analyzers", None)
+    return list(members.values()) if isinstance(members, dict) else [processor]
+
+
+def reference(processor):
+    """``(box, pixels_per_cm)`` of the first analyzer that has a reference object, or None."""
+    for analyzer in analyzers(processor):
+        get_reference = getattr(analyzer, "get_reference", None)
+        ref = get_reference() if get_reference is not None else None
+        if ref is not None:
+            return ref
+    return None
+
+
+class SessionLog:
+    """Appends one record per analyzed frame; records are written in chunks of ``chunk``."""
+
+    def __init__(self, path, max_people=1, chunk=64):
+        self.path = path
+        self.max_people = max_people
+        self.dtype = record_dtype(max_people)
+        self.start = time.monotonic()
+        self.buffer = np.zeros(chunk, dtype=self.dtype)
+        self.pending = 0
+        self.frames = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.f = open(path, "wb")
+        header = json.dumps({"version": VERSION, "max_people": max_people,
+                             "start": time.time(), "itemsize": self.dtype.itemsize}).encode()
+        # Pad so records start on an 8-byte boundary
+        header += b" " * (-(len(MAGIC) + 4 + len(header)) % 8)
+        self.f.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def append(self, results, shape, t=None, ref=None):
+        rec = self.buffer[self.pending]
+        rec["t"] = time.monotonic() - self.start if t is None else t
+        rec["size"] = (shape[1], shape[0])
+        if ref is None:
+            rec["ref_box"] = np.nan
+            rec["ref_scale"] = np.nan
+        else:
+            rec["ref_box"], rec["ref_scale"] = ref
+        people = results.keypoints.people if results.keypoints.data is not None else None
+        n = 0 if people is None else min(len(people), self.max_people)
+        rec["n"] = n
+        if n:
+            rec["xy"][:n] = people[:n, :, :2]
+            rec["conf"][:n] = people[:n, :, 2]
+            if results.boxes is not None:
+                rec["box"][:n] = results.boxes[:n]
+            if results.scores is not None:
+                rec["score"][:n] = results.scores[:n]
+        self.pending += 1
+        self.frames += 1
+        if self.pending == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.f.write(self.buffer[:self.pending].tobytes())
+            self.f.flush()
+            self.buffer[:self.pending] = 0
+            self.pending = 0
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+
+class Recorder:
+    """Stands in for an analyzer's ``process_pose`` and logs every result it is given.
+
+    Logging here rather than around the pose model records the capture
+    timestamp the analyzer ran on (not when inference happened to finish),
+    and the results exactly as the analyzer saw them. The analyzer's
+    reference object, as it stands after the frame, is logged with them so
+    a replay needs no detector either.
+    """
+
+    def __init__(self, processor, log):
+        self.processor = processor
+        self.process_pose = processor.process_pose
+        self.log = log
+
+    def __call__(self, frame, results, timestamp=None):
+        out = self.process_pose(frame, results, timestamp)
+        self.log.append(results, frame.shape, timestamp, reference(self.processor))
+        return out
+
+
+def attach(processor, log):
+    """Log the pose results and capture timestamps ``processor`` analyzes, in place."""
+    if not isinstance(vars(processor).get("process_pose"), Recorder):
+        processor.process_pose = Recorder(processor, log)
+    return processor
+
+
+class SessionReader:
+    """Memory-mapped view of a session log; ``records`` is a structured array."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a keypoint session log")
+            (length,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length))
+        self.version = self.header.get("version", 1)
+        self.dtype = record_dtype(self.header["max_people"], self.version)
+        offset = len(MAGIC) + 4 + length
+        # A crash can leave a partial record at the end; ignore it
+        count = (os.path.getsize(path) - offset) // self.dtype.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def results(self, i):
+        rec = self.records[i]
+        n = int(rec["n"])
+        if n == 0:
+            return Results(None)
+        people = np.empty((n, 17, 3))
+        people[..., :2] = rec["xy"][:n]
+        people[..., 2] = rec["conf"][:n]
+        return Results(people[0], rec["box"][:n].astype(np.float64), rec["score"][:n].astype(np.float64), people)
+
+    def reference(self, i):
+        """``(box, pixels_per_cm)`` logged with record ``i``, or None."""
+        if self.version < 2:
+            return None
+        rec = self.records[i]
+        if np.isnan(rec["ref_scale"]):
+            return None
+        return rec["ref_box"].astype(np.float64), float(rec["ref_scale"])
+
+    def replay(self, processor):
+        """Run ``processor`` over the whole log with recorded keypoints instead of inference.
+
+        Analyzers are put in replay mode (``replaying = True``): they skip
+        detectors and snapshots, and get their reference object from the log.
+        """
+        overlay = getattr(processor, "overlay", None)
+        if overlay is not None:
+            overlay.render_on_frame = False
+        members = analyzers(processor)
+        for analyzer in members:
+            analyzer.replaying = True
+        restore = [a.set_reference for a in members if hasattr(a, "set_reference")]
+
+        frame = None
+        for i in range(len(self.records)):
+            w, h = self.records["size"][i]
+            if frame is None or frame.shape[:2] != (h, w):
+                # Analyzers only need the frame's geometry here
+                frame = np.zeros((h, w, 3), dtype=np.uint8)
+            if restore:
+                ref = self.reference(i)
+                for set_reference in restore:
+                    set_reference(ref)
+            processor.process_pose(frame, self.results(i), float(self.records["t"][i]))
+        return processor
+
+
+def main(argv=None):
+    import runner
+
+    parser = argparse.ArgumentParser(description="Re-score a recorded keypoint session without inference.")
+    parser.add_argument("test", type=runner.test_name, help="test name, or several joined with +")
+    parser.add_argument("log", help="session log (.kplog)")
+    parser.add_argument("--height", type=float, default=170, help="athlete height in cm")
+    args = parser.parse_args(argv)
+
+    reader = SessionReader(args.log)
+    start = time.perf_counter()
+    with runner.quiet_stdout():
+        processor = reader.replay(runner.make_processor(args.test, args.height))
+    wall = time.perf_counter() - start
+    print(json.dumps({
+        "test": args.test,
+        "log": args.log,
+        "frames": len(reader),
+        "wall_s": round(wall, 3),
+        "fps": round(len(reader) / wall, 1) if wall > 0 else None,
+        "result": processor.summary(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,154 @@
 import cv2
 import numpy as np
-from yolo_onnx import YOLOv8Pose, YOLOv8Detect
+from yolo_onnx import get_pose_model, get_detect_model
+from overlay import Overlay
+from ring_buffer import RollingStats
 
 class SitReachBoxAnalyzer:
     def __init__(self):
-        self.pose_model = YOLOv8Pose("yolov8n-pose.onnx")
+        self.pose_model = get_pose_model("yolov8n-pose.onnx")
         # We assume the user will provide this model. If not, it will fail gracefully or we can try-catch.
         try:
-            self.box_model = YOLOv8Detect("sitreach.onnx") # User needs to export this!
+            self.box_model = get_detect_model("sitreach.onnx") # User needs to export this!
         except:
             print("Warning: sitreach.onnx not found. Box detection disabled.")
             self.box_model = None
             
-        self.box_history = []
-        self.scale_history = []
         self.last_pixels_per_cm = None
         self.BOX_REAL_HEIGHT_CM = 30.0
         self.max_reach_cm = -999
 
-    def process_frame(self, frame):
-        # 1. Detect Box
-        box_bbox = None
-        if self.box_model:
-            box_results = self.box_model(frame)
-            if box_results.boxes:
-                # Take best box
-                best_box = max(box_results.boxes, key=lambda b: b.conf.numpy()[0])
-                if best_box.conf.numpy()[0] > 0.15:
-                    box_bbox = best_box.xyxy[0] # x1, y1, x2, y2
-
-        # 2. Detect Pose
-        pose_results = self.pose_model(frame)
-        
-        # Draw Box
-        pixels_per_cm = None
+        # --- BOX CACHE ---
+        # The box does not move during a test, so the detector only runs
+        # until STABLE_FRAMES consecutive detections agree, and again when
+        # the scene around the box changes
+        self.STABLE_FRAMES = 5
+        self.box_history = RollingStats(self.STABLE_FRAMES, shape=(4,))
+        self.scale_history = RollingStats(self.STABLE_FRAMES)
+        self.STABLE_TOL = 0.03 # Corner jitter allowed, as a fraction of box height
+        self.box_bbox = None
+        self.box_locked = False
+
+        # Scene-change check on a small grey thumbnail of the box area
+        self.THUMB_SIZE = (96, 54)
+        self.SCENE_DIFF = 25 # Grey levels for a pixel to count as changed
+        self.SCENE_CHANGE_FRACTION = 0.5 # An arm over the box covers less than this
+        self.SCENE_CHANGE_FRAMES = 3
+        self.scene_ref = None
+        self.scene_roi = None
+        self.scene_changed_count = 0
+
+        # Set by SessionReader.replay: the box comes from the log, not the detector
+        self.replaying = False
+
+        self.overlay = Overlay()
+
+    def thumbnail(self, frame):
+        small = cv2.resize(frame, self.THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def lock_box(self, frame):
+        self.box_locked = True
+        self.scene_ref = self.thumbnail(frame)
+
+        # Box area (with a margin) in thumbnail coordinates
+        h, w = frame.shape[:2]
+        tw, th = self.THUMB_SIZE
+        x1, y1, x2, y2 = self.box_bbox
+        mx, my = (x2 - x1) * 0.25, (y2 - y1) * 0.25
+        tx1 = int(max(0, (x1 - mx) * tw / w)); tx2 = int(min(tw, (x2 + mx) * tw / w + 1))
+        ty1 = int(max(0, (y1 - my) * th / h)); ty2 = int(min(th, (y2 + my) * th / h + 1))
+        self.scene_roi = (slice(ty1, max(ty2, ty1 + 4)), slice(tx1, max(tx2, tx1 + 4)))
+        self.scene_changed_count = 0
+        print(f"[INFO] Box locked, {self.last_pixels_per_cm:.2f} px/cm")
+
+    def scene_changed(self, frame):
+        thumb = self.thumbnail(frame)
+        diff = cv2.absdiff(thumb[self.scene_roi], self.scene_ref[self.scene_roi])
+        if np.mean(diff > self.SCENE_DIFF) > self.SCENE_CHANGE_FRACTION:
+            self.scene_changed_count += 1
+        else:
+            self.scene_changed_count = 0
+        return self.scene_changed_count >= self.SCENE_CHANGE_FRAMES
+
+    def get_reference(self):
+        """Cached box and its scale, for the session log; None until there is one."""
+        if self.box_bbox is None or not self.last_pixels_per_cm:
+            return None
+        return self.box_bbox, self.last_pixels_per_cm
+
+    def set_reference(self, reference):
+        """Take the box from a session log instead of detecting it."""
+        if reference is None:
+            self.box_bbox = None
+            self.last_pixels_per_cm = None
+            self.box_locked = False
+        else:
+            self.box_bbox, self.last_pixels_per_cm = reference
+            self.box_locked = True
+
+    def update_box(self, frame):
+        if self.box_model is None or self.replaying:
+            return
+
+        if self.box_locked:
+            if not self.scene_changed(frame):
+                return
+            print("[INFO] Camera or box moved, re-detecting box")
+            self.box_locked = False
+            self.box_history.clear()
+            self.scale_history.clear()
+
+        box_results = self.box_model(frame)
+        if len(box_results.conf) == 0:
+            return
+        best = np.argmax(box_results.conf)
+        if box_results.conf[best] <= 0.15:
+            return
+        bbox = box_results.xyxy[best] # x1, y1, x2, y2
+        box_height_px = bbox[3] - bbox[1]
+        if box_height_px <= 0:
+            return
+
+        # Start over if the new detection disagrees with what we have
+        tol = max(3.0, self.STABLE_TOL * box_height_px)
+        if len(self.box_history) and np.max(np.abs(bbox - self.box_history.median())) > tol:
+            self.box_history.clear()
+            self.scale_history.clear()
+
+        self.box_history.append(bbox)
+        self.scale_history.append(box_height_px / self.BOX_REAL_HEIGHT_CM)
+
+        # The cached box is the median of recent detections
+        self.box_bbox = self.box_history.median()
+        self.last_pixels_per_cm = float(self.scale_history.median())
+
+        if self.box_history.full():
+            self.lock_box(frame)
+
+    def process_frame(self, frame, timestamp=None):
+        return self.process_pose(frame, self.pose_model(frame), timestamp)
+
+    def process_pose(self, frame, pose_results, timestamp=None):
+        self.overlay.begin(frame.shape)
+
+        # 1. Detect Box (only while its geometry is not yet stable)
+        self.update_box(frame)
+        box_bbox = self.box_bbox
+
+        # 2. Pose comes in from the caller (our own model or a shared station inference)
+
+        # Draw Box (green once locked, yellow while still settling)
         if box_bbox is not None:
             bx1, by1, bx2, by2 = map(int, box_bbox)
-            cv2.rectangle(frame, (bx1, by1), (bx2, by2), (0, 255, 0), 2)
-            
-            box_height_px = by2 - by1
-            if box_height_px > 0:
-                pixels_per_cm = box_height_px / self.BOX_REAL_HEIGHT_CM
-                self.last_pixels_per_cm = pixels_per_cm
+            box_color = (0, 255, 0) if self.box_locked else (0, 255, 255)
+            self.overlay.rect((bx1, by1), (bx2, by2), box_color, 2)
         
-        if pixels_per_cm is None:
-            pixels_per_cm = self.last_pixels_per_cm
+        pixels_per_cm = self.last_pixels_per_cm
 
         # 3. Logic
         if pose_results.keypoints.data is not None and pixels_per_cm:
-            frame = self.pose_model.draw_skeleton(frame, pose_results.keypoints.data)
+            self.overlay.skeleton(pose_results.keypoints.data)
             kps = pose_results.keypoints.data
             
             l_wrist = kps[9]; r_wrist = kps[10]
@@ -83,7 +183,13 @@ class SitReachBoxAnalyzer:
                     if reach_cm > self.max_reach_cm:
                         self.max_reach_cm = reach_cm
                         
-                    cv2.putText(frame, f"Reach: {reach_cm:.1f} cm", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 0), 3)
-                    cv2.putText(frame, f"Max: {self.max_reach_cm:.1f} cm", (50, 150), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 215, 0), 3)
+                    self.overlay.text(f"Reach: {reach_cm:.1f} cm", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 0), 3)
+                    self.overlay.text(f"Max: {self.max_reach_cm:.1f} cm", (50, 150), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 215, 0), 3)
+
+        return self.overlay.finish(frame)
 
-        return frame
+    def summary(self):
+        return {
+            "max_reach_cm": self.max_reach_cm if self.max_reach_cm > -999 else None,
+            "pixels_per_cm": self.last_pixels_per_cm,
+        }
@@ -1,13 +1,48 @@
 import cv2
 import numpy as np
-from yolo_onnx import YOLOv8Pose
+from yolo_onnx import get_pose_model, PoseTracker
+from overlay import Overlay
+
+# Shoulder, hip, knee keypoints for the left and right side
+SIDES = np.array([[5, 11, 13], [6, 12, 14]])
+
+
+def hip_angles(people):
+    """Hip angle and confidence of both sides of every person.
+
+    ``people`` is (N, 17, 3); returns two (N, 2) arrays, the angle in
+    degrees and the lowest confidence of the three joints, side 0 left.
+    """
+    pts = people[:, SIDES] # (N, 2, 3, 3)
+    a, b, c = pts[..., 0, :2], pts[..., 1, :2], pts[..., 2, :2]
+    radians = (np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0])
+               - np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]))
+    angle = np.abs(np.degrees(radians))
+    angle = np.where(angle > 180.0, 360.0 - angle, angle)
+    return angle, pts[..., 2].min(axis=-1)
+
 
 class SitUpCounter:
-    def __init__(self):
+    # Counts from joint angles only, so the camera mode may change mid-test
+    scale_invariant = True
+
+    def __init__(self, group=False, max_people=8, max_age=45):
+        # group=True counts every athlete in frame (e.g. a row of mats)
+        # with their own counter, kept through up to max_age frames unseen
+        self.group = group
+        # Ask for every person per call, so the shared model is used
+        # (and a Station knows to ask for everyone)
+        self.multi = group
+        self.max_people = max_people if group else 1
         # Initialize the ONNX wrapper
-        self.model = YOLOv8Pose("yolov8n-pose.onnx")
+        self.model = get_pose_model("yolov8n-pose.onnx")
         self.counter = 0
         self.stage = None  # "down" or "up"
+        self.tracker = PoseTracker(max_age=max_age) if group else None
+        self.athletes = {} # track id -> {"counter", "stage"}
+        # Joints less sure than this (e.g. hidden by a neighbour) do not move the stage
+        self.MIN_CONF = 0.3
+        self.overlay = Overlay()
 
     def calculate_angle(self, a, b, c):
         """
@@ -26,16 +61,25 @@ class SitUpCounter:
 
         return angle
 
-    def process_frame(self, frame):
+    def process_frame(self, frame, timestamp=None):
         """
         Process a single frame: detect pose, count sit-ups, draw skeleton.
         """
         # Run inference
-        results = self.model(frame)
+        return self.process_pose(frame, self.model(frame, multi=self.multi), timestamp)
+
+    def process_pose(self, frame, results, timestamp=None):
+        """
+        Count sit-ups from pose results already computed for this frame.
+        """
+        if self.group:
+            return self.process_group(frame, results)
+
+        self.overlay.begin(frame.shape)
 
         # If no person detected, just return the frame
         if results.keypoints.data is None:
-            return frame
+            return self.overlay.finish(frame)
 
         # We'll take the first person detected
         # keypoints shape is (17, 3) -> (x, y, conf)
@@ -63,15 +107,62 @@ class SitUpCounter:
             print(f"Sit-up count: {self.counter}")
 
         # Draw the skeleton and landmarks
-        frame = self.model.draw_skeleton(frame, person_kpts)
+        self.overlay.skeleton(person_kpts)
 
         # Draw the angle and count
-        cv2.putText(frame, str(int(angle)), 
+        self.overlay.text(str(int(angle)), 
                     (int(l_hip[0]), int(l_hip[1])), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
 
-        cv2.putText(frame, f'Sit-ups: {self.counter}', 
+        self.overlay.text(f'Sit-ups: {self.counter}', 
                     (10, 50), 
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
         
-        return frame
+        return self.overlay.finish(frame)
+
+    def process_group(self, frame, results):
+        """Count reps separately for every tracked person in the frame."""
+        self.overlay.begin(frame.shape)
+        ids = self.tracker.update(results)[:self.max_people]
+
+        if len(ids):
+            people = results.keypoints.people[:len(ids)]
+            angles, conf = hip_angles(people)
+            side = np.argmax(conf, axis=1)
+            rows = np.arange(len(people))
+            angle, side_conf = angles[rows, side], conf[rows, side]
+            hips = people[rows, SIDES[side, 1], :2]
+
+            for i, tid in enumerate(ids):
+                athlete = self.athletes.setdefault(int(tid), {"counter": 0, "stage": None})
+                if side_conf[i] > self.MIN_CONF:
+                    if angle[i] > 120:
+                        athlete["stage"] = "down"
+                    if angle[i] < 30 and athlete["stage"] == "down":
+                        athlete["stage"] = "up"
+                        athlete["counter"] += 1
+                        print(f"Athlete {tid + 1} sit-up count: {athlete['counter']}")
+
+                self.overlay.skeleton(people[i])
+                x, y = int(hips[i][0]), int(hips[i][1])
+                self.overlay.text(str(int(angle[i])), (x, y),
+                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
+                x1, y1 = int(results.boxes[i][0]), int(results.boxes[i][1])
+                self.overlay.text(f"#{tid + 1}: {athlete['counter']}", (x1, max(y1 - 10, 20)),
+                                  cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
+
+        self.counter = sum(a["counter"] for a in self.athletes.values())
+        self.overlay.text(f'Sit-ups: {self.counter} ({len(ids)} athletes)',
+                    (10, 50),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2, cv2.LINE_AA)
+
+        return self.overlay.finish(frame)
+
+    def summary(self):
+        if self.group:
+            return {
+                "situps": self.counter,
+                # Tracks that never completed a rep are passers-by or false detections
+                "athletes": {tid + 1: a["counter"] for tid, a in sorted(self.athletes.items()) if a["counter"]},
+            }
+        return {"situps": self.counter}
@@ -0,0 +1,36 @@
+from overlay import OverlayGroup
+from yolo_onnx import get_pose_model
+
+
+class Station:
+    """Several tests on one camera, sharing one pose inference per frame.
+
+    Each frame goes through the pose model once and the results are handed
+    to every analyzer's ``process_pose``, so each keeps its own state
+    machine and overlay but an extra test only costs its own logic. Looks
+    like a single analyzer to the pipeline, runner and FlowPose: the shared
+    model is ``model``, overlays are drawn together and ``summary()`` is
+    keyed by test name.
+    """
+
+    def __init__(self, analyzers, model=None):
+        # analyzers: {name: analyzer}, each with process_pose(frame, results, timestamp)
+        self.analyzers = dict(analyzers)
+        self.model = model or get_pose_model("yolov8n-pose.onnx")
+        self.overlay = OverlayGroup(analyzer.overlay for analyzer in self.analyzers.values())
+        # Only safe to rescale mid-session if every test is
+        self.scale_invariant = all(getattr(a, "scale_invariant", False) for a in self.analyzers.values())
+        # Everyone in frame if any test needs it (best person still first)
+        self.multi = any(getattr(a, "multi", False) for a in self.analyzers.values())
+        self.max_people = max(getattr(a, "max_people", 1) for a in self.analyzers.values())
+
+    def process_frame(self, frame, timestamp=None):
+        return self.process_pose(frame, self.model(frame, multi=self.multi), timestamp)
+
+    def process_pose(self, frame, results, timestamp=None):
+        for analyzer in self.analyzers.values():
+            analyzer.process_pose(frame, results, timestamp)
+        return self.overlay.finish(frame)
+
+    def summary(self):
+        return {name: analyzer.summary() for name, analyzer in self.analyzers.items()}
@@ -1,87 +1,183 @@
 import cv2
 import numpy as np
-from yolo_onnx import YOLOv8Pose
+from yolo_onnx import get_pose_model
+from overlay import Overlay
+from ring_buffer import RollingStats
+from jump_timing import G_CM_S2, frame_time, crossing, ballistic_peak, flight_height_cm, flight_time_s
 
 class VerticalJumpAnalyzer:
     def __init__(self, user_height_cm=170):
-        self.model = YOLOv8Pose("yolov8n-pose.onnx")
+        self.model = get_pose_model("yolov8n-pose.onnx")
         self.user_height_cm = user_height_cm
-        
+
+        # Calibration runs for a stretch of time, not a number of frames,
+        # so a lower or uneven frame rate does not change it
         self.calib_frames = []
         self.calib_data = None
-        self.CALIB_COUNT = 30
-        
-        self.hip_hist = []
+        self.CALIB_SECONDS = 1.0
+        self.MIN_CALIB_SAMPLES = 5
+
+        # Short median only to keep noise out of the state changes; the
+        # height itself comes from the raw, timestamped samples. Three, not
+        # five: at ~7 fps five samples outlast a 20 cm jump's flight and the
+        # median never leaves the baseline
+        self.hip_hist = RollingStats(3)
         self.stage = "waiting"
         self.peak_hip = None
         self.baseline_hip = None
+        self.baseline_ankle = None
         self.pix_per_cm = None
-        
+
+        # Feet off the ground: ankles this far above their standing level
+        self.TAKEOFF_CM = 3.0
+        self.last_sample = None # (t, hip_y, ankle_y or None)
+        self.takeoff_t = None
+        self.landing_t = None
+        self.flight = [] # (t, hip_y) samples between take-off and landing
+        self.check_ankles = False
+
         self.final_height_cm = 0.0
+        # Cross-check against h = g t^2 / 8 when the ankles give the flight time
+        self.check_flight_time = True
+        self.FLIGHT_TOLERANCE = 0.25
+        self.flight_tolerance_cm = None
+        self.flight_time_s = None
+        self.flight_height_cm = None
+        self.overlay = Overlay()
+
+    def process_frame(self, frame, timestamp=None):
+        return self.process_pose(frame, self.model(frame), timestamp)
+
+    def process_pose(self, frame, results, timestamp=None):
+        self.overlay.begin(frame.shape)
+        t = frame_time(timestamp)
 
-    def process_frame(self, frame):
-        results = self.model(frame)
-        
         if results.keypoints.data is not None:
-            frame = self.model.draw_skeleton(frame, results.keypoints.data)
+            self.overlay.skeleton(results.keypoints.data)
             kps = results.keypoints.data
-            
+
             l_hip, r_hip = kps[11], kps[12]
             l_ankle, r_ankle = kps[15], kps[16]
             nose = kps[0]
-            
+
             if l_hip[2] > 0.5 and r_hip[2] > 0.5:
                 hip_center_y = (l_hip[1] + r_hip[1]) / 2.0
-                
+                ankle_y = None
+                if l_ankle[2] > 0.5 and r_ankle[2] > 0.5:
+                    ankle_y = (l_ankle[1] + r_ankle[1]) / 2.0
+
                 # Calibration Phase
                 if self.calib_data is None:
-                    if len(self.calib_frames) < self.CALIB_COUNT:
-                        # Collect height data
-                        if l_ankle[2] > 0.5 and r_ankle[2] > 0.5:
-                            avg_ankle_y = (l_ankle[1] + r_ankle[1]) / 2.0
-                            height_px = abs(avg_ankle_y - nose[1])
-                            self.calib_frames.append((height_px, hip_center_y))
-                            cv2.putText(frame, f"Calibrating... {len(self.calib_frames)}/{self.CALIB_COUNT}", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+                    # Collect height data
+                    if ankle_y is not None:
+                        height_px = abs(ankle_y - nose[1])
+                        self.calib_frames.append((t, height_px, hip_center_y, ankle_y))
+                    elapsed = t - self.calib_frames[0][0] if self.calib_frames else 0.0
+                    if elapsed < self.CALIB_SECONDS or len(self.calib_frames) < self.MIN_CALIB_SAMPLES:
+                        progress = min(100, int(elapsed / self.CALIB_SECONDS * 100))
+                        self.overlay.text(f"Calibrating... {progress}%", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
                     else:
                         # Compute calibration
-                        heights = [x[0] for x in self.calib_frames]
-                        hips = [x[1] for x in self.calib_frames]
-                        median_h = np.median(heights)
+                        calib = np.array(self.calib_frames)
+                        median_h = np.median(calib[:, 1])
                         self.pix_per_cm = median_h / self.user_height_cm
-                        self.baseline_hip = np.median(hips)
+                        self.baseline_hip = np.median(calib[:, 2])
+                        self.baseline_ankle = np.median(calib[:, 3])
                         self.calib_data = True
-                
+
                 # Measurement Phase
                 else:
                     # Draw baseline
-                    cv2.line(frame, (0, int(self.baseline_hip)), (frame.shape[1], int(self.baseline_hip)), (0, 150, 255), 1)
-                    
-                    self.hip_hist.append(hip_center_y)
-                    if len(self.hip_hist) > 5: self.hip_hist.pop(0)
-                    hip_s = np.median(self.hip_hist)
-                    
-                    if self.stage == "waiting":
-                        if (self.baseline_hip - hip_s) > (10 * self.pix_per_cm): # Jump started
-                            self.stage = "air"
-                            self.peak_hip = hip_s
-                    
-                    elif self.stage == "air":
-                        if hip_s < self.peak_hip: # Higher (smaller y)
-                            self.peak_hip = hip_s
-                        
-                        # Landing
-                        if abs(self.baseline_hip - hip_s) < (5 * self.pix_per_cm):
-                            self.stage = "done"
-                            jump_px = self.baseline_hip - self.peak_hip
-                            self.final_height_cm = jump_px / self.pix_per_cm
-                    
-                    elif self.stage == "done":
+                    self.overlay.line((0, int(self.baseline_hip)), (frame.shape[1], int(self.baseline_hip)), (0, 150, 255), 1)
+                    self.track(t, hip_center_y, ankle_y)
+
+                    if self.stage == "done":
                         # Reset if standing still for a while? Or just show result
-                        cv2.putText(frame, f"Jump Height: {self.final_height_cm:.1f} cm", (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 0), 3)
-                        
-                        # Reset logic (simple)
-                        if abs(self.baseline_hip - hip_s) < (5 * self.pix_per_cm):
-                             # If we are back at baseline, maybe reset after 3 seconds?
-                             pass
-
-        return frame
+                        self.overlay.text(f"Jump Height: {self.final_height_cm:.1f} cm", (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 0), 3)
+                        if self.flight_height_cm is not None:
+                            agree = abs(self.flight_height_cm - self.final_height_cm) <= self.flight_tolerance_cm
+                            color = (0, 255, 0) if agree else (0, 0, 255)
+                            self.overlay.text(f"Flight {self.flight_time_s * 1000:.0f} ms = {self.flight_height_cm:.1f} cm", (20, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+        return self.overlay.finish(frame)
+
+    def track(self, t, hip_y, ankle_y):
+        """Advance the jump state machine with one timestamped sample."""
+        self.hip_hist.append(hip_y)
+        hip_s = self.hip_hist.median()
+        takeoff_level = self.baseline_ankle - self.TAKEOFF_CM * self.pix_per_cm
+        prev = self.last_sample
+        self.last_sample = (t, hip_y, ankle_y)
+
+        if self.stage == "waiting":
+            # Feet leaving the ground: interpolate the instant the ankles
+            # crossed the take-off level between the two samples around it
+            if ankle_y is not None and ankle_y < takeoff_level:
+                if self.takeoff_t is None:
+                    if prev is not None and prev[2] is not None and prev[2] >= takeoff_level:
+                        self.takeoff_t, frac = crossing(prev[0], prev[2], t, ankle_y, takeoff_level)
+                        self.flight = [(self.takeoff_t, prev[1] + frac * (hip_y - prev[1]))]
+                    else:
+                        self.takeoff_t = t
+                        self.flight = []
+            elif ankle_y is not None:
+                # Only a heel raise, still on the ground
+                self.takeoff_t = None
+                self.flight = []
+            if self.takeoff_t is not None:
+                self.flight.append((t, hip_y))
+
+            if (self.baseline_hip - hip_s) > (10 * self.pix_per_cm): # Jump started
+                self.stage = "air"
+                if self.takeoff_t is None:
+                    # Ankles not visible: fall back to the hip leaving its baseline
+                    if prev is not None:
+                        self.takeoff_t, _ = crossing(prev[0], prev[1], t, hip_y, self.baseline_hip)
+                        self.flight = [(self.takeoff_t, self.baseline_hip)]
+                    self.flight.append((t, hip_y))
+                    self.check_ankles = False
+                else:
+                    self.check_ankles = True
+
+        elif self.stage == "air":
+            if self.landing_t is None:
+                if ankle_y is not None and ankle_y >= takeoff_level and prev is not None and prev[2] is not None:
+                    self.landing_t, frac = crossing(prev[0], prev[2], t, ankle_y, takeoff_level)
+                    self.flight.append((self.landing_t, prev[1] + frac * (hip_y - prev[1])))
+                else:
+                    self.flight.append((t, hip_y))
+
+            # Landing
+            if abs(self.baseline_hip - hip_s) < (5 * self.pix_per_cm):
+                self.stage = "done"
+                self.finish_jump()
+
+    def finish_jump(self):
+        ts, ys = zip(*self.flight)
+        # Flight is a parabola in time, so the true peak is found even when
+        # no frame landed exactly on it
+        _, self.peak_hip = ballistic_peak(ts, ys)
+        jump_px = self.baseline_hip - self.peak_hip
+        self.final_height_cm = jump_px / self.pix_per_cm
+
+        if self.check_flight_time and self.check_ankles and self.landing_t is not None:
+            # The ankles were timed above TAKEOFF_CM, not above the floor;
+            # on a parabola that only adds TAKEOFF_CM to the height
+            self.flight_height_cm = flight_height_cm(self.landing_t - self.takeoff_t) + self.TAKEOFF_CM
+            self.flight_time_s = flight_time_s(self.flight_height_cm)
+            # Each end is only pinned down to within the sampling, so allow
+            # for a sample interval of flight time: dh = g t dt / 4
+            dt = np.median(np.diff(ts)) if len(ts) > 1 else 0.0
+            self.flight_tolerance_cm = (self.FLIGHT_TOLERANCE * max(self.final_height_cm, 1.0)
+                                        + G_CM_S2 * self.flight_time_s * dt / 4.0)
+            if abs(self.flight_height_cm - self.final_height_cm) > self.flight_tolerance_cm:
+                print(f"[WARN] Jump height {self.final_height_cm:.1f} cm disagrees with flight time "
+                      f"{self.flight_time_s * 1000:.0f} ms ({self.flight_height_cm:.1f} cm)")
+
+    def summary(self):
+        done = self.stage == "done"
+        return {
+            "jump_height_cm": self.final_height_cm if done else None,
+            "flight_time_s": self.flight_time_s if done else None,
+            "flight_height_cm": self.flight_height_cm if done else None,
+        }
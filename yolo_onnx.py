@@ -1,108 +1,458 @@
+import json
+import os
+import platform
+import threading
+import time
+from collections import OrderedDict
+
 import cv2
 import numpy as np
 
-class YOLOv8Pose:
-    def __init__(self, path, conf_thres=0.5, iou_thres=0.45):
+from instrumentation import instr
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# Where the auto-selected inference engine is remembered between runs
+ENGINE_CACHE = "engine_cache.json"
+
+
+def _as_size(input_size):
+    # Accept 640 or (width, height) such as (640, 384) for landscape frames
+    if isinstance(input_size, (int, np.integer)):
+        return int(input_size), int(input_size)
+    width, height = input_size
+    return int(width), int(height)
+
+
+class Letterbox:
+    """Aspect-preserving resize into a preallocated model input tensor.
+
+    The frame is scaled to fit ``input_size`` and centred on a grey canvas,
+    so nothing is squashed. The canvas and the float32 blob are allocated
+    once and reused for every frame.
+    """
+
+    def __init__(self, input_size=640, pad_value=114):
+        self.width, self.height = _as_size(input_size)
+        self.pad_value = pad_value
+        self.canvas = np.full((self.height, self.width, 3), pad_value, dtype=np.uint8)
+        self._region = None
+
+    def geometry(self, shape):
+        h, w = shape[:2]
+        scale = min(self.width / w, self.height / h)
+        new_w = min(self.width, int(round(w * scale)))
+        new_h = min(self.height, int(round(h * scale)))
+        pad_x = (self.width - new_w) // 2
+        pad_y = (self.height - new_h) // 2
+        return scale, pad_x, pad_y, new_w, new_h
+
+    def fill(self, img, out):
+        """Letterbox ``img`` into ``out`` (3 x H x W float32, RGB, 0..1).
+
+        Returns ``(scale, pad_x, pad_y)`` needed to map model coordinates
+        back onto the original frame.
+        """
+        scale, pad_x, pad_y, new_w, new_h = self.geometry(img.shape)
+        region = (pad_x, pad_y, new_w, new_h)
+        if region != self._region:
+            # Only re-grey the borders when the frame geometry changes
+            self.canvas.fill(self.pad_value)
+            self._region = region
+
+        view = self.canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w]
+        if (new_w, new_h) == (img.shape[1], img.shape[0]):
+            view[...] = img
+        else:
+            cv2.resize(img, (new_w, new_h), dst=view, interpolation=cv2.INTER_LINEAR)
+
+        # BGR HWC uint8 -> RGB CHW float32, written straight into the reused blob
+        np.multiply(self.canvas[:, :, ::-1].transpose(2, 0, 1), 1 / 255.0, out=out)
+        return scale, pad_x, pad_y
+
+
+def top_candidates(scores, conf_thres, top_k):
+    """Indices of anchors scoring above ``conf_thres``, at most ``top_k`` of them."""
+    idx = np.flatnonzero(scores > conf_thres)
+    if idx.size > top_k:
+        idx = idx[np.argpartition(scores[idx], -top_k)[-top_k:]]
+    return idx
+
+
+def xywh_to_xyxy(boxes):
+    xyxy = np.empty_like(boxes)
+    half_w = boxes[:, 2] / 2
+    half_h = boxes[:, 3] / 2
+    xyxy[:, 0] = boxes[:, 0] - half_w
+    xyxy[:, 1] = boxes[:, 1] - half_h
+    xyxy[:, 2] = boxes[:, 0] + half_w
+    xyxy[:, 3] = boxes[:, 1] + half_h
+    return xyxy
+
+
+def nms(boxes, scores, iou_thres):
+    """Greedy non-maximum suppression on x1,y1,x2,y2 boxes in pure NumPy.
+
+    Returns the kept indices, best score first.
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    order = np.argsort(-scores)
+    keep = np.empty(order.size, dtype=np.intp)
+    n = 0
+    while order.size:
+        i = order[0]
+        keep[n] = i
+        n += 1
+        rest = order[1:]
+        iw = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = iw * ih
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return keep[:n]
+
+
+def unletterbox(points, scale, pad_x, pad_y):
+    """Map model-space x,y (last axis starting with x, y) back onto the frame, in place."""
+    points[..., 0] -= pad_x
+    points[..., 1] -= pad_y
+    points[..., :2] /= scale
+    return points
+
+
+class OpenCVEngine:
+    """cv2.dnn inference with an explicit backend and target."""
+
+    name = "opencv"
+
+    def __init__(self, path, dnn_backend=cv2.dnn.DNN_BACKEND_OPENCV, dnn_target=cv2.dnn.DNN_TARGET_CPU):
         self.net = cv2.dnn.readNetFromONNX(path)
+        self.net.setPreferableBackend(dnn_backend)
+        self.net.setPreferableTarget(dnn_target)
+        self.options = {"dnn_backend": dnn_backend, "dnn_target": dnn_target}
+
+    def run(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward()
+
+
+class OnnxRuntimeEngine:
+    """ONNX Runtime CPU inference with full graph optimizations."""
+
+    name = "onnxruntime"
+
+    def __init__(self, path, intra_op_threads=0, inter_op_threads=0):
+        if onnxruntime is None:
+            raise RuntimeError("onnxruntime is not installed")
+        opts = onnxruntime.SessionOptions()
+        opts.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        # 0 lets onnxruntime pick from the number of cores
+        opts.intra_op_num_threads = intra_op_threads
+        opts.inter_op_num_threads = inter_op_threads
+        self.session = onnxruntime.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.options = {"intra_op_threads": intra_op_threads, "inter_op_threads": inter_op_threads}
+
+    def run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+ENGINES = {
+    OpenCVEngine.name: OpenCVEngine,
+    OnnxRuntimeEngine.name: OnnxRuntimeEngine,
+}
+
+
+def available_engines():
+    """(name, options) pairs worth trying on this machine."""
+    candidates = [("opencv", {})]
+    if onnxruntime is not None:
+        candidates.append(("onnxruntime", {}))
+        candidates.append(("onnxruntime", {"intra_op_threads": 1}))
+    return candidates
+
+
+def _engine_cache_key(path, input_size):
+    width, height = _as_size(input_size)
+    return f"{os.path.abspath(path)}|{width}x{height}|{platform.machine()}|{os.cpu_count()}"
+
+
+def _read_engine_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def benchmark_engine(engine, input_size, runs=5):
+    """Median seconds per forward pass on a blank input."""
+    width, height = _as_size(input_size)
+    blob = np.zeros((1, 3, height, width), dtype=np.float32)
+    engine.run(blob) # First run allocates buffers, don't count it
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        engine.run(blob)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def auto_select_engine(path, input_size=640, cache_path=ENGINE_CACHE):
+    """Build the fastest available engine for ``path`` on this machine.
+
+    The winner of a short startup benchmark is stored in ``cache_path`` so
+    later runs skip straight to it.
+    """
+    cache = _read_engine_cache(cache_path)
+    key = _engine_cache_key(path, input_size)
+    if key in cache:
+        choice = cache[key]
+        try:
+            return ENGINES[choice["engine"]](path, **choice["options"])
+        except Exception as e:
+            print(f"[WARN] Cached engine {choice['engine']} failed, re-benchmarking: {e}")
+
+    best, best_time = None, None
+    for name, options in available_engines():
+        try:
+            engine = ENGINES[name](path, **options)
+            elapsed = benchmark_engine(engine, input_size)
+        except Exception as e:
+            print(f"[WARN] Engine {name} {options} unavailable: {e}")
+            continue
+        print(f"[INFO] Engine {name} {options}: {elapsed * 1000:.1f} ms")
+        if best_time is None or elapsed < best_time:
+            best, best_time = engine, elapsed
+
+    if best is None:
+        raise RuntimeError(f"No inference engine could load {path}")
+
+    cache[key] = {"engine": best.name, "options": best.options, "ms": round(best_time * 1000, 2)}
+    try:
+        with open(cache_path, "w") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        print(f"[WARN] Could not write {cache_path}: {e}")
+    return best
+
+
+def create_engine(path, backend="opencv", input_size=640, **options):
+    """Build an inference engine by name, or benchmark and pick one with "auto"."""
+    if backend == "auto":
+        return auto_select_engine(path, input_size)
+    return ENGINES[backend](path, **options)
+
+
+# Keypoint connections for drawing skeleton (COCO format)
+SKELETON = [
+    (15, 13), (13, 11), (16, 14), (14, 12), (11, 12), 
+    (5, 11), (6, 12), (5, 6), (5, 7), (6, 8), 
+    (7, 9), (8, 10), (1, 2), (0, 1), (0, 2), 
+    (1, 3), (2, 4), (3, 5), (4, 6)
+]
+PALETTE = [
+    (255, 128, 0), (255, 153, 51), (255, 178, 102), (230, 230, 0), (255, 153, 255),
+    (153, 204, 255), (255, 102, 255), (255, 51, 255), (102, 178, 255), (51, 153, 255),
+    (255, 153, 153), (255, 102, 102), (255, 51, 51), (153, 255, 153), (102, 255, 102),
+    (51, 255, 51), (0, 255, 0), (0, 0, 255), (255, 0, 0), (255, 255, 255)
+]
+
+# Limbs and joints are drawn one colour group at a time (legs, torso, arms,
+# head / face, arms, legs), each group in a single cv2.polylines call
+_LIMBS = np.array(SKELETON)
+LIMB_GROUPS = [
+    (_LIMBS[0:4], PALETTE[0]),
+    (_LIMBS[4:8], PALETTE[4]),
+    (_LIMBS[8:12], PALETTE[8]),
+    (_LIMBS[12:19], PALETTE[12]),
+]
+POINT_GROUPS = [
+    (np.arange(0, 5), PALETTE[0]),
+    (np.arange(5, 11), PALETTE[5]),
+    (np.arange(11, 17), PALETTE[11]),
+]
+
+
+def draw_pose(img, kpts, conf=0.5, scale=(1.0, 1.0)):
+    """Draw a (17, 3) skeleton with a handful of batched polylines calls.
+
+    ``scale`` maps keypoint coordinates onto ``img`` when it is drawn at a
+    different resolution than the keypoints were measured at.
+    """
+    pts = np.round(kpts[:, :2] * scale).astype(np.int32)
+    visible = kpts[:, 2] > conf
+
+    for limbs, color in LIMB_GROUPS:
+        shown = limbs[visible[limbs[:, 0]] & visible[limbs[:, 1]]]
+        if shown.size:
+            cv2.polylines(img, pts[shown], False, color, 2)
+
+    # A zero-length thick segment is drawn as a filled dot of radius 5
+    for joints, color in POINT_GROUPS:
+        shown = joints[visible[joints]]
+        if shown.size:
+            dots = np.repeat(pts[shown][:, np.newaxis], 2, axis=1)
+            cv2.polylines(img, dots, False, color, 10)
+    return img
+
+
+class _YOLOv8Model:
+    """Shared loading, preprocessing and (batched) inference for YOLOv8 ONNX models.
+
+    One instance is shared by every analyzer through the registry, and its
+    input blob and letterbox canvas are reused across calls, so a call (or
+    batch) holds the model's lock from preprocessing until its results
+    are built. Concurrent callers (a Station, the pipeline worker, a
+    worker left over from a stopped camera) queue instead of overwriting
+    each other's input.
+    """
+
+    stage_name = "model" # Prefix for instrumentation stages
+
+    def __init__(self, path, conf_thres=0.5, iou_thres=0.45, input_size=640, top_k=100, max_batch=1,
+                 backend="opencv", engine_options=None):
+        # backend is "opencv", "onnxruntime" or "auto" (benchmark once, then cached);
+        # engine_options go to the engine, e.g. dnn_target or intra_op_threads
+        self.engine = create_engine(path, backend, input_size, **(engine_options or {}))
         self.conf_thres = conf_thres
         self.iou_thres = iou_thres
-        # Keypoint connections for drawing skeleton (COCO format)
-        self.skeleton = [
-            (15, 13), (13, 11), (16, 14), (14, 12), (11, 12), 
-            (5, 11), (6, 12), (5, 6), (5, 7), (6, 8), 
-            (7, 9), (8, 10), (1, 2), (0, 1), (0, 2), 
-            (1, 3), (2, 4), (3, 5), (4, 6)
-        ]
-        self.palette = [
-            (255, 128, 0), (255, 153, 51), (255, 178, 102), (230, 230, 0), (255, 153, 255),
-            (153, 204, 255), (255, 102, 255), (255, 51, 255), (102, 178, 255), (51, 153, 255),
-            (255, 153, 153), (255, 102, 102), (255, 51, 51), (153, 255, 153), (102, 255, 102),
-            (51, 255, 51), (0, 255, 0), (0, 0, 255), (255, 0, 0), (255, 255, 255)
-        ]
-
-    def __call__(self, img, verbose=False):
-        # Preprocess
-        blob = cv2.dnn.blobFromImage(img, 1/255.0, (640, 640), swapRB=True, crop=False)
-        self.net.setInput(blob)
-        
-        # Inference
-        # Output shape: 1 x 56 x 8400
-        # 56 channels: 4 box (cx,cy,w,h) + 1 score + 51 kpts (17 * 3)
-        out = self.net.forward()
-        
-        # Postprocess
-        out = out[0] # Remove batch dim -> 56 x 8400
-        out = out.transpose() # -> 8400 x 56
-        
-        # Filter by score
-        scores = out[:, 4]
-        mask = scores > self.conf_thres
-        out = out[mask]
-        scores = scores[mask]
-        
-        if len(out) == 0:
-            return Results(None)
-            
-        # NMS
-        boxes = out[:, 0:4]
-        # Convert cx,cy,w,h to x1,y1,w,h for NMS
-        boxes_nms = boxes.copy()
-        boxes_nms[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
-        boxes_nms[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
-        
-        indices = cv2.dnn.NMSBoxes(boxes_nms.tolist(), scores.tolist(), self.conf_thres, self.iou_thres)
-        
-        if len(indices) == 0:
+        # input_size must match the size the ONNX file was exported with
+        # (see export_model.py), e.g. 320, 416, 480 or (640, 384)
+        self.letterbox = Letterbox(input_size)
+        # One reused input slot per frame of the largest batch
+        self.max_batch = max_batch
+        self.blob = np.empty((max_batch, 3, self.letterbox.height, self.letterbox.width), dtype=np.float32)
+        self.top_k = top_k
+        self._lock = threading.Lock()
+
+    def __call__(self, img, verbose=False, **kwargs):
+        if not instr.enabled:
+            with self._lock:
+                geometry = self.preprocess(img)
+                out = self.forward()
+                return self.postprocess(out, geometry, **kwargs)
+
+        with self._lock:
+            t0 = time.perf_counter()
+            geometry = self.preprocess(img)
+            t1 = time.perf_counter()
+            out = self.forward()
+            t2 = time.perf_counter()
+            results = self.postprocess(out, geometry, **kwargs)
+            t3 = time.perf_counter()
+        instr.record(f"{self.stage_name}.preprocess", t1 - t0)
+        instr.record(f"{self.stage_name}.forward", t2 - t1)
+        instr.record(f"{self.stage_name}.postprocess", t3 - t2)
+        return results
+
+    def preprocess(self, img, slot=0):
+        return self.letterbox.fill(img, self.blob[slot])
+
+    def forward(self, n=1):
+        return self.engine.run(self.blob[:n])
+
+    def infer_batch(self, frames, **kwargs):
+        """Run a list of frames through the network ``max_batch`` at a time.
+
+        Each chunk is letterboxed into one N x C x H x W blob and costs a
+        single forward pass. Returns one result per frame, in order.
+        """
+        results = []
+        for start in range(0, len(frames), self.max_batch):
+            chunk = frames[start:start + self.max_batch]
+            with self._lock:
+                geometries = [self.preprocess(img, slot) for slot, img in enumerate(chunk)]
+                out = self.forward(len(chunk))
+                for i, geometry in enumerate(geometries):
+                    results.append(self.postprocess(out[i:i + 1], geometry, **kwargs))
+        return results
+
+    def warmup(self):
+        # The first forward() on a fresh net allocates its layer buffers,
+        # so pay for it once here instead of on the first camera frame
+        self(np.zeros((self.letterbox.height, self.letterbox.width, 3), dtype=np.uint8))
+
+
+class YOLOv8Pose(_YOLOv8Model):
+    # Output shape: N x 56 x A (A = 8400 anchors for a 640 x 640 input)
+    # 56 channels: 4 box (cx,cy,w,h) + 1 score + 51 kpts (17 * 3)
+
+    stage_name = "pose"
+
+    def __init__(self, path, conf_thres=0.5, iou_thres=0.45, input_size=640, top_k=100, max_batch=1,
+                 backend="opencv", engine_options=None, multi=False):
+        super().__init__(path, conf_thres, iou_thres, input_size, top_k, max_batch, backend, engine_options)
+        # multi=True returns every detected person instead of only the best
+        self.multi = multi
+        # Keypoint connections and colours for drawing skeleton (COCO format)
+        self.skeleton = SKELETON
+        self.palette = PALETTE
+
+    def postprocess(self, out, geometry, multi=None):
+        if multi is None:
+            multi = self.multi
+        out = out[0] # Remove batch dim -> 56 x A
+
+        # Threshold on the score row first so only candidates get gathered
+        scores = out[4]
+        idx = top_candidates(scores, self.conf_thres, self.top_k)
+        if idx.size == 0:
             return Results(None)
-            
-        # Get best detection (assuming single person for now or taking best)
-        idx = indices[0] # Take best match
-        best_det = out[idx]
-        
-        # Extract keypoints
-        # Keypoints start at index 5
-        # Shape: 17 keypoints * 3 values (x, y, conf)
-        kpts_raw = best_det[5:]
-        kpts = []
-        
-        # Scale keypoints back to original image size
-        h, w = img.shape[:2]
-        scale_x = w / 640
-        scale_y = h / 640
-        
-        for i in range(0, len(kpts_raw), 3):
-            x, y, conf = kpts_raw[i], kpts_raw[i+1], kpts_raw[i+2]
-            kpts.append([x * scale_x, y * scale_y, conf])
-            
-        return Results(np.array(kpts))
+
+        if not multi:
+            # Only the best person is kept, which is always the first NMS
+            # survivor, so NMS itself can be skipped
+            keep = idx[np.argmax(scores[idx])][np.newaxis]
+        else:
+            boxes = xywh_to_xyxy(out[:4, idx].T)
+            keep = idx[nms(boxes, scores[idx], self.iou_thres)]
+
+        # Keypoints start at channel 5: 17 keypoints * (x, y, conf)
+        det = out[:, keep].T.astype(np.float64)
+        people = unletterbox(det[:, 5:].reshape(-1, 17, 3), *geometry)
+        boxes = xywh_to_xyxy(det[:, :4])
+        unletterbox(boxes.reshape(-1, 2, 2), *geometry)
+        return Results(people[0], boxes, det[:, 4], people)
 
     def draw_skeleton(self, img, kpts):
-        # Draw points
-        for i, (x, y, conf) in enumerate(kpts):
-            if conf > 0.5:
-                cv2.circle(img, (int(x), int(y)), 5, self.palette[i % len(self.palette)], -1)
-        
-        # Draw lines
-        for i, (idx1, idx2) in enumerate(self.skeleton):
-            if idx1 < len(kpts) and idx2 < len(kpts):
-                x1, y1, c1 = kpts[idx1]
-                x2, y2, c2 = kpts[idx2]
-                if c1 > 0.5 and c2 > 0.5:
-                    cv2.line(img, (int(x1), int(y1)), (int(x2), int(y2)), self.palette[i % len(self.palette)], 2)
-        return img
+        return draw_pose(img, kpts)
 
 class Results:
-    def __init__(self, kpts):
-        self.keypoints = Keypoints(kpts)
+    def __init__(self, kpts, boxes=None, scores=None, people=None):
+        # kpts is the best person (17, 3); people holds everyone (N, 17, 3),
+        # best first, with matching boxes (N, 4) x1,y1,x2,y2 and scores (N,)
+        self.keypoints = Keypoints(kpts, people)
+        self.boxes = boxes
+        self.scores = scores
+        self.ids = None # Filled in by PoseTracker.update
         
+    def scaled(self, sx, sy):
+        """Copy with every coordinate multiplied by ``sx`` (x) and ``sy`` (y)."""
+        if self.keypoints.data is None:
+            return Results(None)
+        people = self.keypoints.people * (sx, sy, 1.0)
+        boxes = None if self.boxes is None else self.boxes * (sx, sy, sx, sy)
+        results = Results(people[0], boxes, self.scores, people)
+        results.ids = self.ids
+        return results
+
     def plot(self, boxes=False):
         # This is a dummy method to satisfy existing code structure
         # The actual drawing should be done by passing the image to draw_skeleton
         return None 
 
 class Keypoints:
-    def __init__(self, data):
+    def __init__(self, data, people=None):
         self.data = data # numpy array of shape (17, 3)
+        if people is None and data is not None:
+            people = data[np.newaxis]
+        self.people = people # numpy array of shape (N, 17, 3)
         
     @property
     def xy(self):
@@ -111,7 +461,7 @@ class Keypoints:
         # We will return a wrapper that behaves like that
         if self.data is None:
             return Wrapper(np.array([]))
-        return Wrapper(np.expand_dims(self.data[:, :2], axis=0))
+        return Wrapper(self.people[..., :2])
 
 class Wrapper:
     def __init__(self, data):
@@ -124,61 +474,218 @@ class Wrapper:
     def numpy(self):
         return self.data
 
-class YOLOv8Detect:
-    def __init__(self, path, conf_thres=0.5, iou_thres=0.45):
-        self.net = cv2.dnn.readNetFromONNX(path)
-        self.conf_thres = conf_thres
-        self.iou_thres = iou_thres
+class RoiPose:
+    """Single-person pose inference on a crop around the previous detection.
 
-    def __call__(self, img, verbose=False):
-        blob = cv2.dnn.blobFromImage(img, 1/255.0, (640, 640), swapRB=True, crop=False)
-        self.net.setInput(blob)
-        out = self.net.forward()
-        
-        out = out[0].transpose()
-        
-        # Output shape: 8400 x (4 + num_classes)
-        if out.shape[1] < 5:
-             return DetectResults([])
-
-        scores = np.max(out[:, 4:], axis=1)
-        mask = scores > self.conf_thres
-        out = out[mask]
-        scores = scores[mask]
-        
-        if len(out) == 0:
-            return DetectResults([])
-            
-        class_ids = np.argmax(out[:, 4:], axis=1)
-        boxes = out[:, 0:4]
-        
-        boxes_nms = boxes.copy()
-        boxes_nms[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
-        boxes_nms[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
-        
-        indices = cv2.dnn.NMSBoxes(boxes_nms.tolist(), scores.tolist(), self.conf_thres, self.iou_thres)
-        
-        final_boxes = []
+    After a confident full-frame detection, following frames only send a
+    padded crop around the last keypoint bounding box through the network,
+    which costs less and gives small, distant subjects more pixels. Results
+    are mapped back to full-frame coordinates. When confidence drops the
+    next frame falls back to full-frame detection.
+
+    ``roi_model`` can be a smaller-input model (e.g. input_size=320) used
+    for the crops only. Everything else is delegated to ``model``.
+    """
+
+    def __init__(self, model, roi_model=None, pad=0.3, min_conf=0.5, min_kpts=8, kpt_conf=0.5, min_size=96):
+        self.model = model
+        self.roi_model = roi_model or model
+        self.pad = pad
+        self.min_conf = min_conf
+        self.min_kpts = min_kpts
+        self.kpt_conf = kpt_conf
+        self.min_size = min_size
+        self.roi = None # x1, y1, x2, y2 in frame pixels
+        self.roi_shape = None # Frame shape the ROI was found in
+
+    def __getattr__(self, name):
+        # draw_skeleton, skeleton, palette, ... come from the wrapped model
+        return getattr(self.model, name)
+
+    def __call__(self, img, verbose=False, multi=False):
+        if multi:
+            # A crop only ever holds one person; everyone needs the whole frame
+            return self.model(img, multi=True)
+        if self.roi is not None and self.roi_shape != img.shape[:2]:
+            # The camera mode changed; the ROI is in the old frame's pixels
+            self.roi = None
+        crop = self._crop(img) if self.roi is not None else None
+        if crop is not None:
+            x1, y1 = self.roi[:2]
+            results = self.roi_model(crop, multi=False)
+            if self._confident(results):
+                results.keypoints.people[..., 0] += x1
+                results.keypoints.people[..., 1] += y1
+                results.boxes[:, [0, 2]] += x1
+                results.boxes[:, [1, 3]] += y1
+                self._update_roi(results, img.shape)
+                return results
+            self.roi = None # Lost the athlete, look at the whole frame again
+
+        results = self.model(img, multi=False)
+        if self._confident(results):
+            self._update_roi(results, img.shape)
+        return results
+
+    def _crop(self, img):
+        """The ROI clipped to ``img``, or None (ROI dropped) if too little of it is left."""
         h, w = img.shape[:2]
-        scale_x = w / 640
-        scale_y = h / 640
-        
-        for i in indices:
-            idx = i if isinstance(i, (int, np.integer)) else i[0]
-            box = boxes_nms[idx]
-            x, y, bw, bh = box
-            
-            x1 = x * scale_x
-            y1 = y * scale_y
-            x2 = (x + bw) * scale_x
-            y2 = (y + bh) * scale_y
-            
-            conf = scores[idx]
-            cls = class_ids[idx]
-            
-            final_boxes.append(Box(x1, y1, x2, y2, conf, cls))
-            
-        return DetectResults(final_boxes)
+        x1, y1, x2, y2 = self.roi
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w, x2), min(h, y2)
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            self.roi = None
+            return None
+        self.roi = (x1, y1, x2, y2)
+        return img[y1:y2, x1:x2]
+
+    def _confident(self, results):
+        if results.keypoints.data is None or results.scores[0] < self.min_conf:
+            return False
+        return np.count_nonzero(results.keypoints.data[:, 2] > self.kpt_conf) >= self.min_kpts
+
+    def _update_roi(self, results, shape):
+        kpts = results.keypoints.data
+        seen = kpts[kpts[:, 2] > self.kpt_conf, :2]
+        (x1, y1), (x2, y2) = seen.min(axis=0), seen.max(axis=0)
+
+        # Pad by a fraction of the larger side so limbs moving between frames stay inside
+        pad = self.pad * max(x2 - x1, y2 - y1)
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        half_w = max(x2 - x1 + 2 * pad, self.min_size) / 2
+        half_h = max(y2 - y1 + 2 * pad, self.min_size) / 2
+
+        h, w = shape[:2]
+        x1, x2 = int(max(0, cx - half_w)), int(min(w, cx + half_w))
+        y1, y2 = int(max(0, cy - half_h)), int(min(h, cy + half_h))
+        self.roi = (x1, y1, x2, y2) if x2 > x1 and y2 > y1 else None
+        self.roi_shape = tuple(shape[:2])
+
+    def reset(self):
+        self.roi = None
+
+
+def box_iou(a, b):
+    """Pairwise IoU between x1,y1,x2,y2 boxes, shape (len(a), len(b))."""
+    a = a[:, np.newaxis]
+    b = b[np.newaxis]
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / (area_a + area_b - inter + 1e-9)
+
+
+class PoseTracker:
+    """Gives each detected person a stable ID across frames.
+
+    Detections are matched greedily to existing tracks on a cost mixing box
+    IoU and the mean distance between confidently seen keypoints (relative
+    to the track's box size). Tracks not seen for ``max_age`` frames are
+    dropped.
+    """
+
+    def __init__(self, max_cost=0.7, iou_weight=0.5, max_age=15, kpt_conf=0.5):
+        self.max_cost = max_cost
+        self.iou_weight = iou_weight
+        self.max_age = max_age
+        self.kpt_conf = kpt_conf
+        self.next_id = 0
+        self.track_ids = np.zeros(0, dtype=np.intp)
+        self.track_boxes = np.zeros((0, 4))
+        self.track_kpts = np.zeros((0, 17, 3))
+        self.track_age = np.zeros(0, dtype=np.intp)
+
+    def _cost(self, boxes, kpts):
+        iou = box_iou(boxes, self.track_boxes)
+
+        # Keypoint distance, only over joints confidently seen in both
+        diff = kpts[:, np.newaxis, :, :2] - self.track_kpts[np.newaxis, :, :, :2]
+        dist = np.linalg.norm(diff, axis=-1)
+        seen = (kpts[:, np.newaxis, :, 2] > self.kpt_conf) & (self.track_kpts[np.newaxis, :, :, 2] > self.kpt_conf)
+        n_seen = seen.sum(axis=-1)
+        mean_dist = np.where(seen, dist, 0).sum(axis=-1) / np.maximum(n_seen, 1)
+        size = np.hypot(self.track_boxes[:, 2] - self.track_boxes[:, 0], self.track_boxes[:, 3] - self.track_boxes[:, 1])
+        kpt_cost = np.where(n_seen > 0, np.minimum(mean_dist / np.maximum(size, 1.0), 1.0), 1.0)
+
+        return self.iou_weight * (1 - iou) + (1 - self.iou_weight) * kpt_cost
+
+    def update(self, results):
+        """Assign IDs to ``results`` (from a multi=True call) and return them."""
+        if results.boxes is None:
+            boxes = np.zeros((0, 4))
+            kpts = np.zeros((0, 17, 3))
+        else:
+            boxes = results.boxes
+            kpts = results.keypoints.people
+
+        n_det, n_trk = len(boxes), len(self.track_ids)
+        ids = np.full(n_det, -1, dtype=np.intp)
+        matched = np.zeros(n_trk, dtype=bool)
+
+        if n_det and n_trk:
+            cost = self._cost(boxes, kpts)
+            for flat in np.argsort(cost, axis=None):
+                d, t = divmod(int(flat), n_trk)
+                if cost[d, t] > self.max_cost:
+                    break
+                if ids[d] < 0 and not matched[t]:
+                    ids[d] = self.track_ids[t]
+                    matched[t] = True
+
+        # Update matched tracks in place, age the rest
+        det_of_track = {tid: d for d, tid in enumerate(ids) if tid >= 0}
+        for t in np.flatnonzero(matched):
+            d = det_of_track[self.track_ids[t]]
+            self.track_boxes[t] = boxes[d]
+            self.track_kpts[t] = kpts[d]
+        self.track_age[matched] = 0
+        self.track_age[~matched] += 1
+
+        alive = self.track_age <= self.max_age
+        new = ids < 0
+        n_new = int(new.sum())
+        ids[new] = np.arange(self.next_id, self.next_id + n_new)
+        self.next_id += n_new
+
+        self.track_ids = np.concatenate([self.track_ids[alive], ids[new]])
+        self.track_boxes = np.concatenate([self.track_boxes[alive], boxes[new]])
+        self.track_kpts = np.concatenate([self.track_kpts[alive], kpts[new]])
+        self.track_age = np.concatenate([self.track_age[alive], np.zeros(n_new, dtype=np.intp)])
+
+        results.ids = ids
+        return ids
+
+    def reset(self):
+        self.__init__(self.max_cost, self.iou_weight, self.max_age, self.kpt_conf)
+
+
+class YOLOv8Detect(_YOLOv8Model):
+    # Output shape: N x (4 + num_classes) x A
+
+    stage_name = "detect"
+
+    def postprocess(self, out, geometry):
+        out = out[0]
+        if out.shape[0] < 5:
+            return DetectResults.empty()
+
+        class_scores = out[4:]
+        scores = class_scores[0] if class_scores.shape[0] == 1 else class_scores.max(axis=0)
+        idx = top_candidates(scores, self.conf_thres, self.top_k)
+        if idx.size == 0:
+            return DetectResults.empty()
+
+        boxes = xywh_to_xyxy(out[:4, idx].T)
+        scores = scores[idx]
+        class_ids = class_scores[:, idx].argmax(axis=0)
+
+        keep = nms(boxes, scores, self.iou_thres)
+        boxes = boxes[keep].astype(np.float64)
+        # View each box as two (x, y) corners so both get unletterboxed
+        unletterbox(boxes.reshape(-1, 2, 2), *geometry)
+        return DetectResults(boxes, scores[keep], class_ids[keep])
 
 class Box:
     def __init__(self, x1, y1, x2, y2, conf, cls):
@@ -187,5 +694,108 @@ class Box:
         self.cls = cls
 
 class DetectResults:
-    def __init__(self, boxes):
-        self.boxes = boxes
+    def __init__(self, xyxy, conf, cls):
+        # Arrays of shape (N, 4), (N,) and (N,); Box objects are only built on demand
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+        self._boxes = None
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.intp))
+
+    @property
+    def boxes(self):
+        if self._boxes is None:
+            self._boxes = [Box(*b, c, k) for b, c, k in zip(self.xyxy, self.conf, self.cls)]
+        return self._boxes
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded, warmed-up models.
+
+    Models are keyed by class, path and constructor config, so every analyzer
+    asking for the same network gets the same instance (calls into it are
+    serialized by the model's own lock). The least recently used models are
+    dropped once more than ``max_models`` are held.
+    """
+
+    def __init__(self, max_models=3):
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _key(self, cls, path, config):
+        items = []
+        for name, value in sorted(config.items()):
+            if isinstance(value, dict):
+                value = tuple(sorted(value.items()))
+            elif isinstance(value, list):
+                value = tuple(value)
+            items.append((name, value))
+        return (cls.__name__, os.path.abspath(path), tuple(items))
+
+    def get(self, cls, path, **config):
+        key = self._key(cls, path, config)
+        while True:
+            with self._lock:
+                model = self._models.get(key)
+                if model is not None:
+                    self._models.move_to_end(key)
+                    return model
+                pending = self._pending.get(key)
+                if pending is None:
+                    # We are the loader for this key
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Someone else (e.g. the warm-up thread) is loading it already
+            pending.wait()
+
+        try:
+            model = cls(path, **config)
+            model.warmup()
+            with self._lock:
+                self._models[key] = model
+                self._models.move_to_end(key)
+                self._evict()
+            return model
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def _evict(self):
+        while len(self._models) > self.max_models:
+            key, _ = self._models.popitem(last=False)
+            print(f"[INFO] Evicted model {key[1]}")
+
+    def clear(self):
+        """Drop every cached model, e.g. when the app is paused."""
+        with self._lock:
+            self._models.clear()
+
+    def warmup_async(self, specs):
+        """Load and warm up ``(cls, path, config)`` specs on a background thread."""
+        def run():
+            for cls, path, config in specs:
+                try:
+                    self.get(cls, path, **config)
+                except Exception as e:
+                    print(f"[WARN] Warm-up of {path} failed: {e}")
+
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+
+registry = ModelRegistry()
+
+
+def get_pose_model(path="yolov8n-pose.onnx", **config):
+    return registry.get(YOLOv8Pose, path, **config)
+
+
+def get_detect_model(path, **config):
+    return registry.get(YOLOv8Detect, path, **config)